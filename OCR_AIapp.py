@@ -1,12 +1,18 @@
 import streamlit as st
-import json
-import os
 from datetime import datetime
-import html
-import uuid
-import requests
+from chat_view import (
+    WINDOW_SIZE, chat_actions, chat_navigation, diagnostics, history_window, init_chat_state, live_reply,
+    memoized_image, message_html, scroll_to_message, theme_picker,
+)
+from core.conversation import DEFAULT_CONTEXT_CONFIG, ocr_analysis_prompt
+from core.metrics import span
+from core.services import Services, load_config, section
+from core.documents import chunk_pages, document_preparer
+from core.ocr import (
+    DEFAULT_OCR_CONFIG, extract_layout_cached, extract_text_cached, iter_batch_ocr, layout_text, render_pdf_pages,
+)
+from core.preprocess import DEFAULT_PREPROCESS_CONFIG
 from PIL import Image
-import pytesseract
 import io
 import base64
 
@@ -14,104 +20,62 @@ import base64
 # Config
 # --------------------
 st.set_page_config(page_title="AI Chat UI with OCR", layout="wide")
-HISTORY_FILE = "chat_sessions.json"
-CONFIG_FILE = "config.json"
+GREETING = "👋 Hi! You can type messages or upload images for OCR analysis."
 
 # --------------------
 # Helpers
 # --------------------
-@st.cache_data
-def load_sessions():
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {}
-    return {}
-
-def save_sessions(sessions):
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(sessions, f, indent=4)
-
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {"theme": "light"}
-    return {"theme": "light"}
-
-def save_config(config):
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=4)
-
-def image_to_base64(image):
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+@st.cache_resource
+def get_services():
+    return Services(load_config())
 
 def base64_to_image(base64_str):
     return Image.open(io.BytesIO(base64.b64decode(base64_str)))
 
 # --------------------
-# OCR Function
+# Replies
 # --------------------
-def extract_text_from_image(image):
-    try:
-        extracted_text = pytesseract.image_to_string(image)
-        return extracted_text.strip()
-    except Exception as e:
-        return f"⚠️ OCR error: {e}"
-
-# --------------------
-# Ollama streaming API
-# --------------------
-def ask_ollama_stream(prompt, model="llama2:latest"):
-    url = "http://localhost:11434/api/generate"
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "max_tokens": 200,
-        "stream": True
-    }
-    try:
-        with requests.post(url, json=payload, stream=True, timeout=120) as r:
-            r.raise_for_status()
-            for line in r.iter_lines():
-                if line:
-                    try:
-                        chunk = json.loads(line.decode("utf-8"))
-                        text = chunk.get("response") or chunk.get("output") or ""
-                        yield text
-                    except json.JSONDecodeError:
-                        continue
-    except Exception as e:
-        yield f"⚠️ Ollama error: {e}"
+def submit_reply(chat_id, prompt, before_id, prepare=None, task=None):
+    """Queues a reply in the background; it streams into a placeholder message in the chat."""
+    message = jobs.submit(store, chat_id, prompt, before_id, section(st.session_state.config, "context", DEFAULT_CONTEXT_CONFIG), prepare, task)
+    st.session_state.sessions[chat_id]["messages"].append(message)
+
+def user_ocr_settings():
+    """OCR settings from config.json with this user's own preprocessing and layout choices applied."""
+    settings = section(st.session_state.config, "ocr", DEFAULT_OCR_CONFIG)
+    settings["preprocess"] = dict(settings["preprocess"], **store.get_preference("ocr_preprocess", {}))
+    settings["layout"]["enabled"] = store.get_preference("ocr_layout", settings["layout"]["enabled"])
+    return settings
+
+def submit_document(chat_id, pages, before_id):
+    """Queues the analysis of layout OCR pages; documents longer than one chunk are summarized part by part first."""
+    layout = user_ocr_settings()["layout"]
+    chunks = chunk_pages(pages, layout["chunk_tokens"])
+    if len(chunks) > 1:
+        submit_reply(chat_id, None, before_id, document_preparer(services.client, chunks, layout), task="ocr")
+    elif chunks:
+        submit_reply(chat_id, ocr_analysis_prompt(chunks[0]), before_id, task="ocr")
+
+def optional_number(toggle, label, value, default, low, high, step):
+    """A number input behind a checkbox; None or 0 (as config.json may set it) means off and returns None."""
+    if not st.checkbox(toggle, value=bool(value)):
+        return None
+    return st.number_input(label, low, high, value=min(max(value or default, low), high), step=step)
 
 # --------------------
 # Session state init
 # --------------------
-if "sessions" not in st.session_state:
-    st.session_state.sessions = load_sessions()
-
-if "config" not in st.session_state:
-    st.session_state.config = load_config()
-    st.session_state.theme = st.session_state.config["theme"]
-
-if "current_chat" not in st.session_state:
-    chat_id = str(uuid.uuid4())
-    st.session_state.current_chat = chat_id
-    st.session_state.sessions[chat_id] = {
-        "title": "New Chat",
-        "messages": [
-            {"role": "assistant", "content": "👋 Hi! You can type messages or upload images for OCR analysis.", "time": datetime.now().isoformat()}
-        ],
-    }
+services = get_services()
+user = services.user_for(st.context.headers, st.query_params)
+store = services.store(user)
+jobs = services.jobs
+blobs = services.blobs
+
+init_chat_state(store, GREETING)
 
 if "ocr_mode" not in st.session_state:
     st.session_state.ocr_mode = False
+    st.session_state.ocr_batch = False
 
 # --------------------
 # Sidebar
@@ -119,67 +83,52 @@ if "ocr_mode" not in st.session_state:
 with st.sidebar:
     st.markdown("### 🛠️ Actions")
     
-    if st.button("➕ New Chat"):
-        chat_id = str(uuid.uuid4())
-        st.session_state.current_chat = chat_id
-        st.session_state.sessions[chat_id] = {
-            "title": "New Chat",
-            "messages": [
-                {"role": "assistant", "content": "✨ New conversation started.", "time": datetime.now().isoformat()}
-            ],
-        }
-        save_sessions(st.session_state.sessions)
-
-    if st.button("🗑 Clear Current Chat"):
-        st.session_state.sessions[st.session_state.current_chat]["messages"] = []
-        save_sessions(st.session_state.sessions)
-
-    if st.button("❌ Delete Current Chat"):
-        chat_id = st.session_state.current_chat
-        if chat_id in st.session_state.sessions:
-            del st.session_state.sessions[chat_id]
-        if st.session_state.sessions:
-            st.session_state.current_chat = list(st.session_state.sessions.keys())[0]
-        else:
-            new_chat_id = str(uuid.uuid4())
-            st.session_state.current_chat = new_chat_id
-            st.session_state.sessions[new_chat_id] = {
-                "title": "New Chat",
-                "messages": [
-                    {"role": "assistant", "content": "👋 Hi! How can I help you today?", "time": datetime.now().isoformat()}
-                ],
-            }
-        save_sessions(st.session_state.sessions)
+    chat_actions(store, GREETING)
 
     st.markdown("---")
     
     st.markdown("### 📷 OCR Mode")
     st.session_state.ocr_mode = st.checkbox("Enable OCR Image Upload", value=st.session_state.ocr_mode)
+    if st.session_state.ocr_mode:
+        st.session_state.ocr_batch = st.checkbox("📚 Batch mode (multiple images / PDF)", value=st.session_state.ocr_batch)
+        layout = user_ocr_settings()["layout"]
+        layout_enabled = st.checkbox(
+            "🧱 Layout-aware OCR for long documents",
+            value=layout["enabled"],
+            help="Keeps text blocks, drops low-confidence words and summarizes long documents part by part.",
+        )
+        if layout_enabled != layout["enabled"]:
+            store.set_preference("ocr_layout", layout_enabled)
+        with st.expander("⚙️ Image preprocessing"):
+            pre = user_ocr_settings()["preprocess"]
+            updated = {
+                "enabled": st.checkbox("Preprocess before OCR", value=pre["enabled"]),
+                "grayscale": st.checkbox("Grayscale", value=pre["grayscale"]),
+                "binarize": st.checkbox("Adaptive binarization", value=pre["binarize"]),
+                "deskew": st.checkbox("Deskew", value=pre["deskew"]),
+                "target_dpi": optional_number(
+                    "Normalize DPI", "Target DPI", pre["target_dpi"], DEFAULT_PREPROCESS_CONFIG["target_dpi"], 72, 600, 50
+                ),
+                "max_side": optional_number(
+                    "Limit image size", "Max image side (px)", pre["max_side"], DEFAULT_PREPROCESS_CONFIG["max_side"], 500, 10000, 250
+                ),
+            }
+            roi = pre["roi"] or [0.0, 0.0, 1.0, 1.0]
+            x_range = st.slider("Crop horizontally (%)", 0, 100, (round(roi[0] * 100), round(roi[2] * 100)))
+            y_range = st.slider("Crop vertically (%)", 0, 100, (round(roi[1] * 100), round(roi[3] * 100)))
+            crop = [x_range[0] / 100, y_range[0] / 100, x_range[1] / 100, y_range[1] / 100]
+            updated["roi"] = None if crop == [0.0, 0.0, 1.0, 1.0] else crop
+            if updated != pre:
+                store.set_preference("ocr_preprocess", updated)
 
     st.markdown("---")
 
-    current_chat = st.session_state.sessions[st.session_state.current_chat]
-    new_title = st.text_input("Edit Chat Title", value=current_chat["title"])
-    if new_title != current_chat["title"]:
-        current_chat["title"] = new_title
-        st.session_state.sessions[st.session_state.current_chat] = current_chat
-        save_sessions(st.session_state.sessions)
-
-    search_query = st.text_input("🔍 Search Chats")
-    st.markdown("<div style='text-align:center; font-size:28px; font-weight:bold;'>💬 Chats</div>", unsafe_allow_html=True)
-    filtered_chats = {cid: c for cid, c in st.session_state.sessions.items() if search_query.lower() in c["title"].lower()}
-    for chat_id in reversed(list(filtered_chats.keys())):
-        chat = filtered_chats[chat_id]
-        if st.button(chat["title"], key=chat_id):
-            st.session_state.current_chat = chat_id
+    chat_navigation(store, jobs)
 
     st.markdown("---")
 
-    theme = st.radio("🎨 Theme", ("Light", "Dark"), index=0 if st.session_state.theme=="light" else 1)
-    if theme.lower() != st.session_state.theme:
-        st.session_state.theme = theme.lower()
-        st.session_state.config["theme"] = st.session_state.theme
-        save_config(st.session_state.config)
+    theme_picker(store)
+    diagnostics(services)
 
 # --------------------
 # CSS Styles
@@ -188,6 +137,8 @@ light_css = """
 <style>
 [data-testid="stAppViewContainer"] {background-color: #f5f7fa !important; color: #1f2937 !important;}
 .user-message {background: linear-gradient(135deg, #6ee7b7, #3b82f6); color: white; padding: 14px 18px; border-radius: 18px 18px 4px 18px; margin: 10px; max-width: 40%; float: left; clear: both; font-size: 16px;}
+.reply-stats {font-size: 12px; opacity: 0.7; margin-top: 6px;}
+.search-hit > div {outline: 3px solid #f59e0b;}
 .bot-message {background: linear-gradient(135deg, #e0e7ff, #f3f4f6); color: #1f2937; padding: 14px 18px; border-radius: 18px 18px 18px 4px; margin: 10px; max-width: 40%; float: right; clear: both; font-size: 16px;}
 .user-image {float: left; clear: both; margin: 10px; max-width: 40%; text-align: left;}
 .user-image img {max-width: 300px; border-radius: 12px;}
@@ -197,6 +148,8 @@ dark_css = """
 <style>
 [data-testid="stAppViewContainer"] {background-color: #1e1e2f !important; color: #f9fafb !important;}
 .user-message {background: linear-gradient(135deg, #2563eb, #9333ea); color: white; padding: 14px 18px; border-radius: 18px 18px 4px 18px; margin: 10px; max-width: 40%; float: left; clear: both; font-size: 16px;}
+.reply-stats {font-size: 12px; opacity: 0.7; margin-top: 6px;}
+.search-hit > div {outline: 3px solid #f59e0b;}
 .bot-message {background: linear-gradient(135deg, #374151, #4b5563); color: #f9fafb; padding: 14px 18px; border-radius: 18px 18px 18px 4px; margin: 10px; max-width: 40%; float: right; clear: both; font-size: 16px;}
 .user-image {float: left; clear: both; margin: 10px; max-width: 40%; text-align: left;}
 .user-image img {max-width: 300px; border-radius: 12px;}
@@ -210,92 +163,185 @@ st.markdown(dark_css if st.session_state.theme=="dark" else light_css, unsafe_al
 current_chat = st.session_state.sessions[st.session_state.current_chat]
 st.markdown(f"<h2 style='text-align:center;'>{current_chat['title']}</h2>", unsafe_allow_html=True)
 
-for msg in current_chat["messages"]:
-    if msg["role"] == "user":
-        if "image" in msg:
+window_size = st.session_state.history_limit.get(st.session_state.current_chat, WINDOW_SIZE)
+hidden_count, visible_messages = history_window(current_chat["messages"], window_size)
+if hidden_count and st.button(f"⬆️ Load older messages ({hidden_count} hidden)"):
+    st.session_state.history_limit[st.session_state.current_chat] = window_size + WINDOW_SIZE
+    st.rerun()
+
+highlight = st.session_state.pop("highlight_message", None)
+with span("render"):
+    for msg in visible_messages:
+        if msg["role"] == "user" and ("image_ref" in msg or "image" in msg):
+            if msg.get("id") == highlight:
+                st.markdown(f'<div id="msg-{highlight}"></div>', unsafe_allow_html=True)
             st.markdown('<div class="user-image">', unsafe_allow_html=True)
             try:
-                img = base64_to_image(msg["image"])
+                if "image_ref" in msg:
+                    img = memoized_image(msg["image_ref"], lambda: blobs.thumbnail_bytes(msg["image_ref"]))
+                else:
+                    img = memoized_image((st.session_state.current_chat, msg["id"]), lambda: base64_to_image(msg["image"]))
                 st.image(img, width=300)
             except:
                 pass
             st.markdown('</div>', unsafe_allow_html=True)
+        elif msg.get("status") and jobs.get(store, msg["id"]):
+            live_reply(jobs, store, msg)
         else:
-            st.markdown(f'<div class="user-message">{html.escape(msg["content"])}</div>', unsafe_allow_html=True)
-    else:
-        st.markdown(f'<div class="bot-message">{html.escape(msg["content"])}</div>', unsafe_allow_html=True)
+            st.markdown(message_html(msg, highlight=msg.get("id") == highlight), unsafe_allow_html=True)
+    if highlight is not None:
+        scroll_to_message(highlight)
 
 # --------------------
 # OCR Upload Auto Processing
 # --------------------
-if st.session_state.ocr_mode:
+if st.session_state.ocr_mode and not st.session_state.ocr_batch:
     st.markdown("### 📷 Upload Image for OCR")
     uploaded_image = st.file_uploader("Upload image for OCR", type=["jpg", "jpeg", "png"], key="ocr_uploader")
 
     if "ocr_processed" not in st.session_state:
         st.session_state.ocr_processed = False
-        st.session_state.last_image_name = None
+        st.session_state.last_image_digest = None
 
     if uploaded_image is not None:
-        image_name = uploaded_image.name
-        if st.session_state.last_image_name != image_name:
+        image_bytes = uploaded_image.getvalue()
+        image_digest = blobs.put(image_bytes)
+        if st.session_state.last_image_digest != image_digest:
             st.session_state.ocr_processed = False
-            st.session_state.last_image_name = image_name
+            st.session_state.last_image_digest = image_digest
 
         if not st.session_state.ocr_processed:
             st.image(uploaded_image, caption="Uploaded Image", width=300)
             with st.spinner("Extracting text and analyzing..."):
-                image = Image.open(uploaded_image)
-                extracted_text = extract_text_from_image(image)
+                settings = user_ocr_settings()
+                ocr_cache = services.ocr_cache
+                if settings["layout"]["enabled"]:
+                    blocks = extract_layout_cached(image_bytes, settings, ocr_cache)
+                    extracted_text = layout_text(blocks)
+                else:
+                    extracted_text = extract_text_cached(image_bytes, settings, ocr_cache)
 
             if extracted_text:
-                current_chat["messages"].append({
+                image_msg = {
                     "role": "user",
-                    "image": image_to_base64(image),
+                    "image_ref": image_digest,
+                    "ocr_text": extracted_text,
                     "time": datetime.now().isoformat()
-                })
-
-                ai_prompt = f"""I've uploaded an image. Here's the text extracted from it:
-
-{extracted_text}
-
-Please analyze this image by:
-1. Explaining what the extracted text means
-2. Describing what type of document or image this appears to be
-3. Providing any insights or summary about the content."""
+                }
+                current_chat["messages"].append(image_msg)
+                store.append_message(st.session_state.current_chat, image_msg)
 
-                reply_placeholder = st.empty()
-                bot_text = ""
-                for chunk in ask_ollama_stream(ai_prompt):
-                    bot_text += chunk
-                    reply_placeholder.markdown(f'<div class="bot-message">{html.escape(bot_text)}</div>', unsafe_allow_html=True)
-
-                current_chat["messages"].append({
-                    "role": "assistant",
-                    "content": bot_text,
-                    "time": datetime.now().isoformat()
-                })
-                st.session_state.sessions[st.session_state.current_chat] = current_chat
-                save_sessions(st.session_state.sessions)
+                if settings["layout"]["enabled"]:
+                    submit_document(st.session_state.current_chat, [(None, blocks)], image_msg["id"])
+                else:
+                    submit_reply(st.session_state.current_chat, ocr_analysis_prompt(extracted_text), image_msg["id"], task="ocr")
 
                 st.session_state.ocr_processed = True
                 st.rerun()
         else:
             st.info("✅ Image already processed. Upload a new one to analyze again.")
 
+# --------------------
+# Batch OCR (multiple images / PDF pages)
+# --------------------
+if st.session_state.ocr_mode and st.session_state.ocr_batch:
+    st.markdown("### 📚 Batch OCR")
+    uploaded_files = st.file_uploader(
+        "Upload images or PDFs for OCR",
+        type=["jpg", "jpeg", "png", "pdf"],
+        accept_multiple_files=True,
+        key="ocr_batch_uploader",
+    )
+    prompt_mode = st.radio("Send extracted text to the model as", ("One combined prompt", "One prompt per page"), horizontal=True)
+    # errors from the last run, kept across the st.rerun() that ends it
+    for error in st.session_state.pop("ocr_batch_errors", []):
+        st.error(error)
+
+    if uploaded_files and st.button("▶️ Run batch OCR"):
+        chat_id = st.session_state.current_chat
+        settings = user_ocr_settings()
+        ocr_cache = services.ocr_cache
+
+        errors = []
+        pages = []  # (label, image bytes)
+        file_msgs = []  # (message, index of its first page)
+        for uploaded in uploaded_files:
+            data = uploaded.getvalue()
+            digest = blobs.put(data)
+            first_page = len(pages)
+            if uploaded.name.lower().endswith(".pdf"):
+                try:
+                    pdf_pages = render_pdf_pages(data, settings["pdf_dpi"])
+                except Exception as e:
+                    errors.append(f"⚠️ {uploaded.name}: {e}")
+                    continue
+                file_msg = {
+                    "role": "user",
+                    "content": f"📄 {uploaded.name} ({len(pdf_pages)} pages)",
+                    "file_ref": digest,
+                    "time": datetime.now().isoformat()
+                }
+                pages.extend((f"{uploaded.name} - page {number}", page) for number, page in enumerate(pdf_pages, start=1))
+            else:
+                file_msg = {"role": "user", "image_ref": digest, "time": datetime.now().isoformat()}
+                pages.append((uploaded.name, data))
+            file_msgs.append((file_msg, first_page))
+
+        use_layout = settings["layout"]["enabled"]
+        texts = [""] * len(pages)
+        layouts = [[] for _ in pages]  # extract_layout blocks per page, with use_layout
+        progress = st.progress(0.0, text=f"Extracting text from {len(pages)} page(s)...")
+        page_slots = [st.empty() for _ in pages]
+        results = iter_batch_ocr([page for _, page in pages], settings, ocr_cache, layout=use_layout)
+        for done, (index, result) in enumerate(results, start=1):
+            if use_layout:
+                layouts[index] = result
+                text = texts[index] = layout_text(result)
+            else:
+                text = texts[index] = result
+            with page_slots[index].container():
+                with st.expander(f"📝 {pages[index][0]}"):
+                    st.text(text or "(no text found)")
+            if text.startswith("⚠️"):
+                # a failed page is reported, not stored or sent to the model
+                errors.append(f"⚠️ {pages[index][0]}: {text.removeprefix('⚠️ ')}")
+                texts[index], layouts[index] = "", []
+            progress.progress(done / len(pages), text=f"Extracted {done}/{len(pages)} page(s)")
+        progress.empty()
+
+        for number, (file_msg, first_page) in enumerate(file_msgs):
+            last_page = file_msgs[number + 1][1] if number + 1 < len(file_msgs) else len(pages)
+            file_msg["ocr_text"] = "\n\n".join(text for text in texts[first_page:last_page] if text)
+            current_chat["messages"].append(file_msg)
+            store.append_message(chat_id, file_msg)
+        turn_start = file_msgs[0][0]["id"] if file_msgs else None
+
+        if use_layout and prompt_mode == "One combined prompt":
+            document = [(label, blocks) for (label, _), blocks in zip(pages, layouts) if blocks]
+            if document:
+                submit_document(chat_id, document, turn_start)
+        elif use_layout:
+            for blocks in layouts:
+                if blocks:
+                    submit_document(chat_id, [(None, blocks)], turn_start)
+        elif prompt_mode == "One combined prompt":
+            combined = "\n\n".join(f"--- {label} ---\n{text}" for (label, _), text in zip(pages, texts) if text)
+            if combined:
+                submit_reply(chat_id, ocr_analysis_prompt(combined), turn_start, task="ocr")
+        else:
+            for text in texts:
+                if text:
+                    submit_reply(chat_id, ocr_analysis_prompt(text), turn_start, task="ocr")
+        st.session_state.ocr_batch_errors = errors
+        st.rerun()
+
 # --------------------
 # Text Input Chat
 # --------------------
 if user_input := st.chat_input("Type your message..."):
-    current_chat["messages"].append({"role": "user", "content": user_input, "time": datetime.now().isoformat()})
-    st.markdown(f'<div class="user-message">{html.escape(user_input)}</div>', unsafe_allow_html=True)
-
-    reply_placeholder = st.empty()
-    bot_text = ""
-    for chunk in ask_ollama_stream(user_input):
-        bot_text += chunk
-        reply_placeholder.markdown(f'<div class="bot-message">{html.escape(bot_text)}</div>', unsafe_allow_html=True)
-
-    current_chat["messages"].append({"role": "assistant", "content": bot_text, "time": datetime.now().isoformat()})
-    st.session_state.sessions[st.session_state.current_chat] = current_chat
-    save_sessions(st.session_state.sessions)
+    user_msg = {"role": "user", "content": user_input, "time": datetime.now().isoformat()}
+    current_chat["messages"].append(user_msg)
+    store.append_message(st.session_state.current_chat, user_msg)
+
+    submit_reply(st.session_state.current_chat, user_input, user_msg["id"])
+    st.rerun()
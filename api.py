@@ -0,0 +1,250 @@
+"""
+HTTP API over the core package, for driving chats and OCR from other services.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+Users are identified like in the Streamlit apps (the "storage" section of
+config.json). Replies are generated on background workers and streamed as
+server-sent events; a client that reconnects, or reaches a different replica,
+can resume a reply from the store with GET .../replies/{id}/stream.
+"""
+import asyncio
+import gzip
+import io
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from fastapi import Depends, FastAPI, File, HTTPException, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from core.conversation import DEFAULT_CONTEXT_CONFIG
+from core.ocr import DEFAULT_OCR_CONFIG, iter_batch_ocr, layout_text, render_pdf_pages
+from core.services import Services, load_config, section
+
+POLL_INTERVAL = 0.1  # seconds between checks of a reply generating in this process
+STORE_POLL_INTERVAL = 0.5  # ... of a reply generating elsewhere, read back from the store
+STALE_AFTER = 300  # stop following a reply whose stored text has not changed for this long
+
+app = FastAPI(title="AI Chat with OCR")
+_services = None
+_services_lock = threading.Lock()
+
+
+# --------------------
+# Dependencies
+# --------------------
+def get_services():
+    # sync dependencies run on the thread pool, so the first requests can race to build it
+    global _services
+    if _services is None:
+        with _services_lock:
+            if _services is None:
+                _services = Services(load_config())
+    return _services
+
+
+def get_store(request: Request, services: Services = Depends(get_services)):
+    return services.store(services.user_for(request.headers, request.query_params))
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class NewSession(BaseModel):
+    title: str = "New Chat"
+    greeting: str | None = None
+
+
+class SessionUpdate(BaseModel):
+    title: str
+
+
+class NewTurn(BaseModel):
+    content: str
+    stream: bool = True
+
+
+# --------------------
+# Sessions
+# --------------------
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/sessions")
+def list_sessions(limit: int = 20, offset: int = 0, store=Depends(get_store)):
+    return {"total": store.count_sessions(), "sessions": store.list_sessions(limit, offset)}
+
+
+@app.post("/sessions", status_code=201)
+def create_session(body: NewSession, store=Depends(get_store)):
+    chat_id = str(uuid.uuid4())
+    messages = []
+    if body.greeting:
+        messages.append({"role": "assistant", "content": body.greeting, "time": datetime.now().isoformat()})
+    store.create_session(chat_id, body.title, messages)
+    return {"id": chat_id, "title": body.title}
+
+
+@app.get("/sessions/{chat_id}")
+def get_session(chat_id: str, store=Depends(get_store)):
+    session = store.load_session(chat_id)
+    if session is None:
+        raise HTTPException(404, "Session not found")
+    return dict(session, id=chat_id)
+
+
+@app.patch("/sessions/{chat_id}")
+def rename_session(chat_id: str, body: SessionUpdate, store=Depends(get_store)):
+    if not store.rename_session(chat_id, body.title):
+        raise HTTPException(404, "Session not found")
+    return {"id": chat_id, "title": body.title}
+
+
+@app.delete("/sessions/{chat_id}", status_code=204)
+def delete_session(chat_id: str, store=Depends(get_store)):
+    store.delete_session(chat_id)
+    return Response(status_code=204)
+
+
+@app.delete("/sessions/{chat_id}/messages", status_code=204)
+def clear_session(chat_id: str, store=Depends(get_store)):
+    store.clear_messages(chat_id)
+    return Response(status_code=204)
+
+
+@app.get("/search")
+def search(q: str, limit: int = 20, store=Depends(get_store)):
+    return {"hits": store.search(q, limit)}
+
+
+@app.get("/export")
+def export_sessions(store=Depends(get_store)):
+    """Every session, archived ones included, streamed as JSONL one session per line."""
+    lines = (json.dumps(record, ensure_ascii=False) + "\n" for record in store.iter_records())
+    return StreamingResponse(iterate_in_threadpool(lines), media_type="application/x-ndjson")
+
+
+@app.post("/import")
+async def import_sessions(file: UploadFile = File(...), store=Depends(get_store)):
+    """Imports a JSONL export (optionally .gz), streaming it line by line; sessions already stored are skipped."""
+    raw = gzip.GzipFile(fileobj=file.file) if (file.filename or "").endswith(".gz") else file.file
+    records = (json.loads(line) for line in io.TextIOWrapper(raw, encoding="utf-8") if line.strip())
+    try:
+        imported = await run_in_threadpool(store.import_records, records)
+    except (ValueError, KeyError, OSError) as e:
+        raise HTTPException(422, f"Invalid export file: {e}")
+    return {"imported": imported}
+
+
+# --------------------
+# Chat turns
+# --------------------
+@app.post("/sessions/{chat_id}/turns")
+async def create_turn(chat_id: str, body: NewTurn, store=Depends(get_store), services=Depends(get_services)):
+    """
+    Stores the user message and queues a reply. Streams the reply as SSE
+    ("reply" with both message ids, then "delta" text chunks and a final
+    "done" with the stored reply) unless body.stream is false.
+    """
+    message = {"role": "user", "content": body.content, "time": datetime.now().isoformat()}
+    try:
+        await run_in_threadpool(store.append_message, chat_id, message)
+    except sqlite3.IntegrityError:
+        raise HTTPException(404, "Session not found")
+    reply = await run_in_threadpool(
+        services.jobs.submit, store, chat_id, body.content, message["id"], section(services.config, "context", DEFAULT_CONTEXT_CONFIG)
+    )
+    ids = {"message_id": message["id"], "reply_id": reply["id"]}
+    if not body.stream:
+        return ids
+
+    async def events():
+        yield sse("reply", ids)
+        async for event in reply_events(services, store, chat_id, reply["id"]):
+            yield event
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/sessions/{chat_id}/replies/{reply_id}/stream")
+async def stream_reply(chat_id: str, reply_id: int, store=Depends(get_store), services=Depends(get_services)):
+    if await run_in_threadpool(store.get_message, reply_id, chat_id) is None:
+        raise HTTPException(404, "Reply not found")
+    return StreamingResponse(reply_events(services, store, chat_id, reply_id), media_type="text/event-stream")
+
+
+async def reply_events(services, store, chat_id, reply_id):
+    """
+    SSE events for one reply: follows the live job when it runs in this
+    process, otherwise the partial text its worker persists to the store.
+    """
+    sent = 0
+    changed_at = time.monotonic()
+    while True:
+        job = services.jobs.get(store, reply_id)
+        if job is not None:
+            # done before text: a job finishing between the two reads still gets its last delta sent
+            done = job.done.is_set()
+            text = job.stream.text if job.stream is not None else ""
+        else:
+            message = await run_in_threadpool(store.get_message, reply_id, chat_id)
+            if message is None:
+                yield sse("error", {"detail": "Reply was deleted"})
+                return
+            text = message.get("content", "")
+            done = not message.get("status") or time.monotonic() - changed_at > STALE_AFTER
+        if len(text) > sent:
+            yield sse("delta", {"text": text[sent:]})
+            sent = len(text)
+            changed_at = time.monotonic()
+        if done:
+            yield sse("done", await run_in_threadpool(store.get_message, reply_id, chat_id))
+            return
+        await asyncio.sleep(POLL_INTERVAL if job is not None else STORE_POLL_INTERVAL)
+
+
+# --------------------
+# OCR
+# --------------------
+@app.post("/ocr")
+async def ocr(files: list[UploadFile] = File(...), layout: bool = False, services=Depends(get_services)):
+    """
+    OCRs uploaded images and PDFs on the worker pool. Streams one SSE "page"
+    event per page ({file, page, text}) in upload order, then "done".
+    With ?layout=true, page events also carry the Tesseract "blocks" (lines,
+    confidence and bounding boxes) and low-confidence words are dropped.
+    """
+    settings = section(services.config, "ocr", DEFAULT_OCR_CONFIG)
+    pages, sources = [], []
+    for upload in files:
+        data = await upload.read()
+        if upload.content_type == "application/pdf" or (upload.filename or "").lower().endswith(".pdf"):
+            try:
+                rendered = await run_in_threadpool(render_pdf_pages, data, settings["pdf_dpi"])
+            except Exception as e:  # no PDF backend, or one that cannot read this file
+                raise HTTPException(422, f"{upload.filename}: {e}")
+        else:
+            rendered = [data]
+        for number, page in enumerate(rendered, start=1):
+            pages.append(page)
+            sources.append({"file": upload.filename, "page": number})
+
+    async def events():
+        results = iter_batch_ocr(pages, settings, services.ocr_cache, layout=layout)
+        async for index, result in iterate_in_threadpool(results):
+            if layout:
+                yield sse("page", dict(sources[index], text=layout_text(result), blocks=result))
+            else:
+                yield sse("page", dict(sources[index], text=result))
+        yield sse("done", {"pages": len(pages)})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,171 @@
+"""
+Stand-in Ollama server for benchmarks and load tests.
+
+Streams NDJSON from /api/chat and /api/generate at a fixed token rate after
+a configurable first-token latency, answers non-streaming calls, /api/embed
+and /api/tags, and ends every stream with Ollama's timing fields.
+
+    python benchmarks/mock_ollama.py --port 11435 --rate 30 --latency 0.3
+    # then point "ollama.host" in config.json at http://127.0.0.1:11435
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = "the quick brown fox jumps over a lazy dog while the model keeps talking".split()
+
+
+class MockOllama:
+    """
+    Mock server on a background thread; use as a context manager.
+    tokens_per_sec and first_token_latency shape every streamed reply,
+    load_latency is added once to the first request (a cold model).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, tokens_per_sec=50.0, first_token_latency=0.2,
+                 reply_tokens=40, load_latency=0.0):
+        self.tokens_per_sec = tokens_per_sec
+        self.first_token_latency = first_token_latency
+        self.reply_tokens = reply_tokens
+        self.load_latency = load_latency
+        self.requests = 0
+        self._loaded = threading.Event()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _load_delay(self):
+        if self._loaded.is_set():
+            return 0.0
+        self._loaded.set()
+        return self.load_latency
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._json({"models": [{"name": "mock:latest"}]})
+
+            def do_POST(self):
+                mock.requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/embed":
+                    inputs = body.get("input", [])
+                    self._json({"embeddings": [_embedding(text) for text in ([inputs] if isinstance(inputs, str) else inputs)]})
+                elif self.path not in ("/api/chat", "/api/generate"):
+                    self.send_error(404)
+                elif body.get("stream") is False:
+                    load = mock._load_delay()
+                    time.sleep(load + mock.first_token_latency + mock.reply_tokens / mock.tokens_per_sec)
+                    self._json(self._chunk(" ".join(_words(mock.reply_tokens)), done=True, load=load))
+                else:
+                    self._stream(mock._load_delay())
+
+            def _chunk(self, text, done, load=0.0):
+                if self.path == "/api/chat":
+                    chunk = {"model": "mock", "message": {"role": "assistant", "content": text}, "done": done}
+                else:
+                    chunk = {"model": "mock", "response": text, "done": done}
+                if done:
+                    eval_seconds = mock.reply_tokens / mock.tokens_per_sec
+                    chunk.update({
+                        "total_duration": int((load + mock.first_token_latency + eval_seconds) * 1e9),
+                        "load_duration": int(load * 1e9),
+                        "prompt_eval_count": 32,
+                        "prompt_eval_duration": int(mock.first_token_latency * 1e9),
+                        "eval_count": mock.reply_tokens,
+                        "eval_duration": int(eval_seconds * 1e9),
+                    })
+                return chunk
+
+            def _stream(self, load):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(load + mock.first_token_latency)
+                interval = 1.0 / mock.tokens_per_sec
+                next_at = time.perf_counter()
+                for word in _words(mock.reply_tokens):
+                    self._write_chunk(self._chunk(word + " ", done=False))
+                    next_at += interval
+                    time.sleep(max(0.0, next_at - time.perf_counter()))
+                self._write_chunk(self._chunk("", done=True, load=load))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, chunk):
+                data = (json.dumps(chunk) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _json(self, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def _words(count):
+    return [WORDS[i % len(WORDS)] for i in range(count)]
+
+
+def _embedding(text, dims=64):
+    """Deterministic unit vector per normalized text."""
+    digest = hashlib.sha256(" ".join(text.split()).lower().encode("utf-8")).digest() * (dims // 32 + 1)
+    vector = [byte - 127.5 for byte in digest[:dims]]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--rate", type=float, default=50.0, help="tokens per second")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per reply")
+    parser.add_argument("--load", type=float, default=0.0, help="extra delay on the first request")
+    args = parser.parse_args()
+
+    mock = MockOllama(args.host, args.port, args.rate, args.latency, args.tokens, args.load)
+    print(f"Mock Ollama listening on {mock.url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
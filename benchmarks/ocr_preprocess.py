@@ -0,0 +1,136 @@
+"""
+OCR preprocessing benchmark.
+
+Runs Tesseract over a set of sample images with preprocessing disabled,
+fully enabled, and with each step switched off in turn, then reports
+median latency and character accuracy for every variant.
+
+    python benchmarks/ocr_preprocess.py                 # synthetic samples
+    python benchmarks/ocr_preprocess.py --images scans/ # img.png + img.txt ground truth
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+import pytesseract
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ocr import extract_text_from_image  # noqa: E402
+from core.preprocess import DEFAULT_PREPROCESS_CONFIG, preprocess_image  # noqa: E402
+
+SAMPLE_TEXT = [
+    "INVOICE No. 20931  Date: 14/03/2025",
+    "Qty  Description           Unit   Total",
+    "2    Thermal paper rolls   4.50   9.00",
+    "1    Barcode scanner      89.99  89.99",
+    "3    Ink cartridge black  21.00  63.00",
+    "Subtotal 161.99  VAT 20% 32.40  Total 194.39",
+    "Thank you for your business!",
+]
+
+STEPS = {
+    # binarization converts to grayscale itself, so grayscale can only be left out together with it
+    "binarize and grayscale": {"binarize": False, "grayscale": False},
+    "binarize": {"binarize": False},
+    "deskew": {"deskew": False},
+    "resize": {"target_dpi": None, "max_side": None},
+}
+
+
+# --------------------
+# Samples
+# --------------------
+def render_page(lines, scale=1.0):
+    font = ImageFont.load_default(size=int(28 * scale))
+    width, line_height = int(1100 * scale), int(48 * scale)
+    image = Image.new("RGB", (width, line_height * (len(lines) + 2)), "white")
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(lines, start=1):
+        draw.text((int(40 * scale), row * line_height), line, fill="black", font=font)
+    return image
+
+
+def uneven_lighting(image):
+    shade = Image.linear_gradient("L").resize(image.size).point(lambda v: 255 - v // 2)
+    return Image.composite(image, Image.new("RGB", image.size, (110, 100, 90)), shade)
+
+
+def synthetic_samples():
+    truth = "\n".join(SAMPLE_TEXT)
+    clean = render_page(SAMPLE_TEXT)
+    skewed = clean.rotate(3.5, expand=True, fillcolor="white")
+    shaded = uneven_lighting(clean).filter(ImageFilter.GaussianBlur(0.8))
+    photo = uneven_lighting(render_page(SAMPLE_TEXT, scale=4.0)).rotate(-2, expand=True, fillcolor=(200, 200, 200))
+    photo.info["dpi"] = (72, 72)
+    return [("clean", clean, truth), ("skewed", skewed, truth), ("shaded", shaded, truth), ("large_photo", photo, truth)]
+
+
+def directory_samples(directory):
+    samples = []
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        base, ext = os.path.splitext(path)
+        if ext.lower() not in (".png", ".jpg", ".jpeg", ".tif", ".tiff") or not os.path.exists(base + ".txt"):
+            continue
+        with open(base + ".txt", "r", encoding="utf-8") as f:
+            samples.append((os.path.basename(path), Image.open(path), f.read()))
+    return samples
+
+
+# --------------------
+# Scoring
+# --------------------
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def char_accuracy(predicted, truth):
+    predicted, truth = " ".join(predicted.split()), " ".join(truth.split())
+    if not truth:
+        return 1.0 if not predicted else 0.0
+    return max(0.0, 1.0 - edit_distance(predicted, truth) / len(truth))
+
+
+def run_variant(image, truth, options, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        text = extract_text_from_image(preprocess_image(image, options))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), char_accuracy(text, truth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="directory of images with .txt ground truth next to them")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        sys.exit("Tesseract is not installed or not on PATH")
+
+    samples = directory_samples(args.images) if args.images else synthetic_samples()
+    variants = [("raw", dict(DEFAULT_PREPROCESS_CONFIG, enabled=False)), ("all steps", DEFAULT_PREPROCESS_CONFIG)]
+    variants += [(f"without {name}", dict(DEFAULT_PREPROCESS_CONFIG, **off)) for name, off in STEPS.items()]
+
+    print(f"{'sample':<16}{'variant':<32}{'latency ms':>12}{'char acc':>10}")
+    for name, image, truth in samples:
+        for label, options in variants:
+            latency, accuracy = run_variant(image, truth, options, args.repeats)
+            print(f"{name:<16}{label:<32}{latency * 1000:>12.1f}{accuracy:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Headless benchmark suite.
+
+    turns        end-to-end reply latency and time to first token through the
+                 background job path, against benchmarks/mock_ollama.py
+    persistence  cost of saving one message as history grows: rewriting a
+                 synthetic chat_sessions.json (the old save_sessions) versus
+                 one SQLite append, plus import and full load times
+    ocr          pages per second on a fixed synthetic corpus, one by one and
+                 on the process pool (skipped without Tesseract)
+
+All results are seconds (lower is better). Save them with --output and
+compare a later run with --baseline; the exit status is 1 when any result is
+slower than the baseline by more than --tolerance.
+
+    python benchmarks/run.py --output baseline.json
+    python benchmarks/run.py --baseline baseline.json --quick
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.conversation import DEFAULT_CONTEXT_CONFIG  # noqa: E402
+from core.jobs import JobManager  # noqa: E402
+from mock_ollama import WORDS, MockOllama  # noqa: E402
+from core.router import OllamaRouter  # noqa: E402
+from core.storage import SessionStore, migrate_json  # noqa: E402
+
+
+# --------------------
+# Turns
+# --------------------
+def bench_turns(workdir, args):
+    """Sequential turns in one chat, then one turn in each of --concurrency chats at once."""
+    results = {}
+    with MockOllama(tokens_per_sec=args.rate, first_token_latency=args.latency, reply_tokens=args.tokens) as mock:
+        client = OllamaRouter.from_config({
+            "ollama": {"host": mock.url, "model": "mock"},
+            "router": {"max_concurrency": args.concurrency, "health_interval": 0},
+        })
+        store = SessionStore(os.path.join(workdir, "turns.db"))
+        jobs = JobManager(client)
+
+        def turn(chat_id, text):
+            message = {"role": "user", "content": text}
+            store.append_message(chat_id, message)
+            start = time.perf_counter()
+            reply = jobs.submit(store, chat_id, text, message["id"], DEFAULT_CONTEXT_CONFIG)
+            job = jobs.get(store, reply["id"])
+            if job is not None:
+                job.done.wait()
+            return time.perf_counter() - start, reply["stats"]["ttft"]
+
+        store.create_session("sequential", "Benchmark")
+        timings = [turn("sequential", f"question {i}") for i in range(args.turns)]
+        results["turn_latency"] = statistics.median(t for t, _ in timings)
+        results["turn_ttft"] = statistics.median(ttft for _, ttft in timings)
+
+        chats = [f"parallel-{i}" for i in range(args.concurrency)]
+        for chat_id in chats:
+            store.create_session(chat_id, "Benchmark")
+        parallel = {}
+        threads = [threading.Thread(target=lambda c=c: parallel.__setitem__(c, turn(c, "hello"))) for c in chats]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results[f"turns_x{args.concurrency}_wall"] = time.perf_counter() - start
+        results[f"turns_x{args.concurrency}_ttft_max"] = max(ttft for _, ttft in parallel.values())
+    return results
+
+
+# --------------------
+# Persistence
+# --------------------
+def synthetic_sessions(count, messages_per_session, seed=7):
+    rng = random.Random(seed)
+    sessions = {}
+    for _ in range(count):
+        messages = [
+            {
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 80))),
+                "time": f"2025-01-01T00:{i % 60:02d}:00",
+            }
+            for i in range(messages_per_session)
+        ]
+        sessions[str(uuid.UUID(int=rng.getrandbits(128)))] = {"title": messages[0]["content"][:30], "messages": messages}
+    return sessions
+
+
+def median_time(action, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_persistence(workdir, args):
+    results = {}
+    for size in args.sizes:
+        sessions = synthetic_sessions(size, args.messages)
+        json_path = os.path.join(workdir, f"chat_sessions_{size}.json")
+
+        def rewrite_json():
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(sessions, f, indent=4)
+
+        results[f"json_save_{size}"] = median_time(rewrite_json, args.repeats)
+
+        store = SessionStore(os.path.join(workdir, f"sessions_{size}.db"))
+        start = time.perf_counter()
+        migrate_json(json_path, store)
+        results[f"sqlite_import_{size}"] = time.perf_counter() - start
+
+        chat_id = next(iter(sessions))
+        message = {"role": "user", "content": "one more message", "time": "2025-01-02T00:00:00"}
+        results[f"sqlite_append_{size}"] = median_time(lambda: store.append_message(chat_id, dict(message)), args.repeats)
+        results[f"sqlite_load_all_{size}"] = median_time(store.load_sessions, max(1, args.repeats // 5))
+        results[f"sqlite_load_one_{size}"] = median_time(lambda: store.load_session(chat_id), args.repeats)
+    return results
+
+
+# --------------------
+# OCR
+# --------------------
+def bench_ocr(workdir, args):
+    import pytesseract
+    from core.ocr import DEFAULT_OCR_CONFIG, extract_text_cached, iter_batch_ocr
+    from core.services import section
+    from ocr_preprocess import SAMPLE_TEXT, render_page
+
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        print("ocr: skipped, Tesseract is not installed or not on PATH")
+        return {}
+
+    pages = []
+    for i in range(args.pages):
+        buffered = io.BytesIO()
+        render_page(SAMPLE_TEXT[i % len(SAMPLE_TEXT):] + SAMPLE_TEXT[:i % len(SAMPLE_TEXT)]).save(buffered, format="PNG")
+        pages.append(buffered.getvalue())
+    settings = section({}, "ocr", DEFAULT_OCR_CONFIG)
+
+    start = time.perf_counter()
+    for page in pages:
+        extract_text_cached(page, settings)
+    sequential = time.perf_counter() - start
+
+    list(iter_batch_ocr(pages[:1], settings))  # start the worker pool outside the timing
+    start = time.perf_counter()
+    list(iter_batch_ocr(pages, settings))
+    pooled = time.perf_counter() - start
+    return {"ocr_page_sequential": sequential / len(pages), "ocr_page_pool": pooled / len(pages)}
+
+
+# --------------------
+# Baseline comparison
+# --------------------
+def compare(results, baseline, tolerance):
+    """Prints every result next to its baseline; returns the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<28}{'ms':>12}{'baseline ms':>14}{'change':>10}")
+    for name, value in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<28}{value * 1000:>12.2f}{'-':>14}{'-':>10}")
+            continue
+        change = (value - before) / before if before else 0.0
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"{name:<28}{value * 1000:>12.2f}{before * 1000:>14.2f}{change:>+10.0%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", choices=("turns", "persistence", "ocr"), action="append",
+                        help="run just these benchmarks (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for CI")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--rate", type=float, default=100.0, help="mock tokens per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=20, help="mock tokens per reply")
+    args = parser.parse_args()
+
+    args.turns = 5 if args.quick else 20
+    args.concurrency = 4 if args.quick else 8
+    args.sizes = [100, 1000] if args.quick else [100, 1000, 5000]
+    args.messages = 10
+    args.repeats = 5 if args.quick else 15
+    args.pages = 4 if args.quick else 12
+
+    benchmarks = {"turns": bench_turns, "persistence": bench_persistence, "ocr": bench_ocr}
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, bench in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            start = time.perf_counter()
+            results.update(bench(workdir, args))
+            print(f"{name}: done in {time.perf_counter() - start:.1f}s")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+    if regressions:
+        sys.exit(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
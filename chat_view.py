@@ -0,0 +1,267 @@
+import html
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from core.metrics import METRICS
+from core.services import load_config
+from core.streaming import stats_footer
+
+WINDOW_SIZE = 30  # messages rendered per "page" of history
+IMAGE_CACHE_SIZE = 256
+SIDEBAR_PAGE_SIZE = 20  # chats listed per sidebar page
+LOADED_CHATS = 8  # chats whose messages a tab keeps in memory
+
+_images = OrderedDict()
+_images_lock = threading.Lock()  # every Streamlit session runs on its own thread
+
+
+# --------------------
+# Message HTML
+# --------------------
+@lru_cache(maxsize=4096)
+def _render(role, content, stats):
+    if role == "user":
+        return f'<div class="user-message">{html.escape(content)}</div>'
+    return f'<div class="bot-message">{html.escape(content)}{stats_footer(dict(stats) if stats else None)}</div>'
+
+
+def message_html(message, highlight=False):
+    """HTML for a text message, cached so unchanged messages are escaped only once."""
+    stats = message.get("stats")
+    rendered = _render(message["role"], message.get("content", ""), tuple(sorted(stats.items())) if stats else None)
+    if highlight:
+        return f'<div id="msg-{message.get("id")}" class="search-hit">{rendered}</div>'
+    return rendered
+
+
+def scroll_to_message(message_id):
+    """Scrolls the page to the message_html(highlight=True) anchor of message_id once it is rendered."""
+    components.html(
+        f"""<script>
+        let tries = 0;
+        const scroll = () => {{
+            const target = window.parent.document.getElementById("msg-{int(message_id)}");
+            if (target) target.scrollIntoView({{behavior: "smooth", block: "center"}});
+            else if (++tries < 20) setTimeout(scroll, 100);
+        }};
+        scroll();
+        </script>""",
+        height=0,
+    )
+
+
+def search_hit_label(hit):
+    snippet = " ".join(hit["snippet"].split())
+    if hit["message_id"] is None:
+        return f"📁 {snippet}"
+    return f"💬 {hit['title']}: {snippet}"
+
+
+# --------------------
+# History window
+# --------------------
+def history_window(messages, size):
+    """Returns (hidden_count, last `size` messages)."""
+    hidden = max(0, len(messages) - size)
+    return hidden, messages[hidden:]
+
+
+def window_including(messages, message_id, size=WINDOW_SIZE):
+    """Smallest window (at least `size`) that still shows message_id."""
+    for position, message in enumerate(messages):
+        if message.get("id") == message_id:
+            return max(size, len(messages) - position)
+    return size
+
+
+def memoized_image(key, load):
+    """Returns load() for key, keeping the most recently used decoded images in memory."""
+    with _images_lock:
+        if key in _images:
+            _images.move_to_end(key)
+            return _images[key]
+    image = load()  # outside the lock, so one slow load doesn't stall other sessions
+    with _images_lock:
+        _images[key] = image
+        if len(_images) > IMAGE_CACHE_SIZE:
+            _images.popitem(last=False)
+    return image
+
+
+# --------------------
+# Chats
+# --------------------
+def new_chat(store, greeting):
+    chat_id = str(uuid.uuid4())
+    chat = {
+        "title": "New Chat",
+        "messages": [
+            {"role": "assistant", "content": greeting, "time": datetime.now().isoformat()}
+        ],
+    }
+    store.create_session(chat_id, chat["title"], chat["messages"])
+    open_chat(store, chat_id, chat)
+
+
+def open_chat(store, chat_id, session=None):
+    """
+    Makes chat_id the current chat, loading its messages on first open.
+    Only the LOADED_CHATS most recently opened chats stay in memory.
+    """
+    sessions = st.session_state.sessions
+    session = session or sessions.get(chat_id) or store.load_session(chat_id)
+    if session is None:
+        return  # deleted meanwhile
+    sessions.pop(chat_id, None)
+    sessions[chat_id] = session
+    while len(sessions) > LOADED_CHATS:
+        oldest = next(iter(sessions))
+        del sessions[oldest]
+        st.session_state.history_limit.pop(oldest, None)
+    st.session_state.current_chat = chat_id
+
+
+def open_latest_chat(store, greeting):
+    latest = store.list_sessions(limit=1)
+    if latest:
+        open_chat(store, latest[0]["id"])
+    else:
+        new_chat(store, greeting)
+
+
+def jump_to(store, chat_id, message_id=None):
+    """Opens a chat and, for message hits, widens its window, highlights the message and scrolls to it."""
+    open_chat(store, chat_id)
+    if st.session_state.current_chat != chat_id:
+        return
+    st.session_state.highlight_message = message_id
+    if message_id is not None:
+        messages = st.session_state.sessions[chat_id]["messages"]
+        st.session_state.history_limit[chat_id] = window_including(messages, message_id)
+
+
+def init_chat_state(store, greeting):
+    """Sets up the tab's chat state on first run, and on every run picks up what other tabs changed."""
+    if "sessions" not in st.session_state:
+        st.session_state.sessions = {}  # chats opened in this tab; others are loaded on demand
+        st.session_state.store_revision = None
+
+    if "history_limit" not in st.session_state:
+        st.session_state.history_limit = {}
+
+    # pick up chats written by this user's other tabs, replicas and reply workers
+    st.session_state.store_revision = store.refresh(st.session_state.sessions, st.session_state.store_revision)
+    if "current_chat" in st.session_state and st.session_state.current_chat not in st.session_state.sessions:
+        open_latest_chat(store, greeting)  # deleted in another tab
+
+    if "config" not in st.session_state:
+        st.session_state.config = load_config()
+        st.session_state.theme = store.get_preference("theme", st.session_state.config.get("theme", "light"))
+
+    if "current_chat" not in st.session_state:
+        new_chat(store, greeting)
+
+
+@st.fragment(run_every=0.5)
+def live_reply(jobs, store, message):
+    """Polls a reply that is still generating; triggers a full rerun once it is done."""
+    job = jobs.get(store, message["id"])
+    if job is None or job.done.is_set():
+        st.rerun()
+    if job.stream is None or not job.stream.escaped_text:
+        st.markdown(f'<div class="bot-message">⏳ {html.escape(job.progress or "Thinking…")}</div>', unsafe_allow_html=True)
+    else:
+        st.markdown(f'<div class="bot-message">{job.stream.escaped_text} ▌</div>', unsafe_allow_html=True)
+
+
+# --------------------
+# Sidebar
+# --------------------
+def chat_actions(store, greeting):
+    if st.button("➕ New Chat"):
+        new_chat(store, "✨ New conversation started.")
+
+    if st.button("🗑 Clear Current Chat"):
+        st.session_state.sessions[st.session_state.current_chat]["messages"] = []
+        store.clear_messages(st.session_state.current_chat)
+
+    if st.button("❌ Delete Current Chat"):
+        chat_id = st.session_state.current_chat
+        st.session_state.sessions.pop(chat_id, None)
+        store.delete_session(chat_id)
+        open_latest_chat(store, greeting)
+
+
+def chat_navigation(store, jobs):
+    """Title of the current chat, search, and the user's chats one page at a time."""
+    current_chat = st.session_state.sessions[st.session_state.current_chat]
+    new_title = st.text_input("Edit Chat Title", value=current_chat["title"])
+    if new_title != current_chat["title"]:
+        current_chat["title"] = new_title
+        store.rename_session(st.session_state.current_chat, new_title)
+
+    search_query = st.text_input("🔍 Search Chats")
+    st.markdown(
+        """<div style="text-align:center; font-size:28px; font-weight:bold; margin-bottom:10px;">💬 Chats</div>""",
+        unsafe_allow_html=True
+    )
+
+    busy_chats = {job.chat_id for job in jobs.active(store)}
+    if busy_chats:
+        st.caption(f"⏳ Generating replies in {len(busy_chats)} chat(s)")
+
+    if search_query.strip():
+        hits = store.search(search_query)
+        if not hits:
+            st.caption("No matches.")
+        for hit in hits:
+            if st.button(search_hit_label(hit), key=f"hit-{hit['chat_id']}-{hit['message_id']}"):
+                jump_to(store, hit["chat_id"], hit["message_id"])
+    else:
+        total = store.count_sessions()
+        pages = max(1, -(-total // SIDEBAR_PAGE_SIZE))
+        page = min(st.session_state.get("sidebar_page", 0), pages - 1)
+        for chat in store.list_sessions(SIDEBAR_PAGE_SIZE, page * SIDEBAR_PAGE_SIZE):
+            marker = "⏳ " if chat["id"] in busy_chats else "🗄️ " if chat["archived"] else ""
+            if st.button(marker + chat["title"], key=chat["id"]):
+                open_chat(store, chat["id"])
+        if pages > 1:
+            newer, position, older = st.columns([1, 2, 1])
+            newer.button("◀", key="page-newer", disabled=page == 0, on_click=_turn_page, args=(-1,))
+            position.caption(f"Page {page + 1} of {pages}")
+            older.button("▶", key="page-older", disabled=page == pages - 1, on_click=_turn_page, args=(1,))
+
+
+def _turn_page(step):
+    st.session_state.sidebar_page = max(0, st.session_state.get("sidebar_page", 0) + step)
+
+
+def theme_picker(store):
+    theme = st.radio("🎨 Theme", ("Light", "Dark"), index=0 if st.session_state.theme=="light" else 1)
+    if theme.lower() != st.session_state.theme:
+        st.session_state.theme = theme.lower()
+        store.set_preference("theme", st.session_state.theme)
+
+
+def diagnostics(services):
+    with st.expander("📈 Diagnostics"):
+        rows = METRICS.summary()
+        if rows:
+            st.dataframe(rows, hide_index=True)
+        else:
+            st.caption("No timings recorded yet.")
+        st.dataframe(services.client.status(), hide_index=True)
+        st.caption(f"Requests waiting for a backend: {services.client.queued()}")
+        counters = METRICS.counters()
+        if counters:
+            st.caption(" · ".join(f"{name}: {value}" for name, value in sorted(counters.items())))
+        messages = st.session_state.sessions[st.session_state.current_chat]["messages"]
+        last_stats = next((m["stats"] for m in reversed(messages) if m.get("stats")), None)
+        if last_stats:
+            st.caption("Last reply: " + ", ".join(f"{name} {value}" for name, value in last_stats.items()))
@@ -0,0 +1,5 @@
+"""
+UI-independent core of the chat app: session storage, blobs, OCR, the Ollama
+client, context building, background reply jobs, caches and metrics. Both
+Streamlit apps and the HTTP API (api.py) are built on it.
+"""
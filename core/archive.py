@@ -0,0 +1,198 @@
+"""
+Cold storage for idle chats, and streaming export/import.
+
+Archived sessions are appended to segment files of compressed JSONL (zstd
+when the zstandard package is installed, else gzip), one compressed frame
+per session. A segment is therefore still an ordinary .jsonl.gz / .jsonl.zst
+file, while any one session can be read back from its (segment, position,
+length) entry in the store's archived_sessions index.
+
+    python -m core.archive archive --days 90
+    python -m core.archive export sessions.jsonl.gz [--user NAME]
+    python -m core.archive import sessions.jsonl.gz [--user NAME]
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_ARCHIVE_CONFIG = {
+    "idle_days": 90,  # sessions untouched this long are archived when their store opens, then every check_hours; 0 = never
+    "check_hours": 6,
+    "compression": "auto",  # "zstd", "gzip", or "auto" for zstd when available
+    "segment_max_bytes": 64 * 1024 * 1024,
+}
+SEGMENT_GRACE_SECONDS = 3600  # a segment written to this recently may hold a frame whose index row is not committed yet
+
+
+def archive_dir(db_path):
+    """Segment directory of one session database, e.g. data/chat_sessions.archive next to data/chat_sessions.db."""
+    return os.path.splitext(db_path)[0] + ".archive"
+
+
+def idle_cutoff(idle_days):
+    """ISO timestamp before which a session counts as idle."""
+    return (datetime.now() - timedelta(days=idle_days)).isoformat()
+
+
+# --------------------
+# Compression
+# --------------------
+def _extension(compression):
+    if compression == "zstd" or (compression == "auto" and zstandard is not None):
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the zstandard package (pip install zstandard)")
+        return ".zst"
+    return ".gz"
+
+
+def _compress(data, extension):
+    if extension == ".zst":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, extension):
+    if extension == ".zst":
+        if zstandard is None:
+            raise RuntimeError("reading .zst archives requires the zstandard package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def open_jsonl(path, mode="r"):
+    """Opens a JSONL file for text reading ("r") or writing ("w"), compressed by its .gz / .zst extension."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(".zst files require the zstandard package (pip install zstandard)")
+        raw = open(path, mode + "b")
+        if mode == "w":
+            stream = zstandard.ZstdCompressor(level=10).stream_writer(raw)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+# --------------------
+# Segments
+# --------------------
+class SessionArchive:
+    """Append-only archive segments in one directory, rotated at segment_max_bytes."""
+
+    def __init__(self, directory, compression=DEFAULT_ARCHIVE_CONFIG["compression"],
+                 segment_max_bytes=DEFAULT_ARCHIVE_CONFIG["segment_max_bytes"]):
+        self.directory = directory
+        self.compression = compression
+        self.segment_max_bytes = segment_max_bytes
+
+    def segments(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.startswith("segment-"))
+
+    def append(self, record):
+        """Writes one session record and returns its (segment, position, length)."""
+        extension = _extension(self.compression)
+        data = _compress((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"), extension)
+        os.makedirs(self.directory, exist_ok=True)
+        segment = self._segment_for(len(data), extension)
+        fd = os.open(os.path.join(self.directory, segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, data)
+            end = os.lseek(fd, 0, os.SEEK_CUR)  # O_APPEND writes land at the end even when processes interleave
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return segment, end - len(data), len(data)
+
+    def read(self, segment, position, length):
+        with open(os.path.join(self.directory, segment), "rb") as f:
+            f.seek(position)
+            data = f.read(length)
+        return json.loads(_decompress(data, os.path.splitext(segment)[1]))
+
+    def delete(self, segment):
+        """
+        Removes a segment no index entry points into any more, unless it is
+        still being appended to or was written within SEGMENT_GRACE_SECONDS:
+        a store may have appended a frame there and not yet committed its
+        index row, even if another store has rotated to a new segment since.
+        """
+        segments = self.segments()
+        if not segments or segment == segments[-1] or segment not in segments:
+            return
+        path = os.path.join(self.directory, segment)
+        if time.time() - os.path.getmtime(path) >= SEGMENT_GRACE_SECONDS:
+            os.remove(path)
+
+    def _segment_for(self, size, extension):
+        segments = self.segments()
+        if segments:
+            last = segments[-1]
+            if last.endswith(extension) and os.path.getsize(os.path.join(self.directory, last)) + size <= self.segment_max_bytes:
+                return last
+        number = int(segments[-1].split("-")[1].split(".")[0]) + 1 if segments else 1
+        return f"segment-{number:06d}.jsonl{extension}"
+
+
+# --------------------
+# Export / import
+# --------------------
+def export_sessions(store, path):
+    """Streams every session of a store, archived ones included, to a JSONL file. Returns the count."""
+    count = 0
+    with open_jsonl(path, "w") as f:
+        for record in store.iter_records():
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def import_sessions(store, path):
+    """Streams sessions from a JSONL export into a store, skipping ids it already has. Returns the count."""
+    with open_jsonl(path, "r") as f:
+        return store.import_records(json.loads(line) for line in f if line.strip())
+
+
+def main():
+    from .services import load_config, section
+    from .storage import DEFAULT_STORAGE_CONFIG, DEFAULT_USER, SessionStore, user_db_path
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("archive", "export", "import"))
+    parser.add_argument("path", nargs="?", help="JSONL file to export to or import from (.gz / .zst to compress)")
+    parser.add_argument("--user", default=DEFAULT_USER)
+    parser.add_argument("--days", type=float, help="archive sessions idle this long (default: idle_days in config.json)")
+    args = parser.parse_args()
+
+    config = load_config()
+    storage = section(config, "storage", DEFAULT_STORAGE_CONFIG)
+    settings = section(config, "archive", DEFAULT_ARCHIVE_CONFIG)
+    path = user_db_path(args.user, storage["users_dir"])
+    archive = SessionArchive(archive_dir(path), settings["compression"], settings["segment_max_bytes"])
+    store = SessionStore(path, storage["journal_mode"], archive)
+
+    if args.command == "archive":
+        days = args.days if args.days is not None else settings["idle_days"]
+        print(f"Archived {store.archive_idle(idle_cutoff(days))} session(s) idle for {days:g} days")
+    elif not args.path:
+        parser.error(f"{args.command} needs a path")
+    elif args.command == "export":
+        print(f"Exported {export_sessions(store, args.path)} session(s) to {args.path}")
+    else:
+        print(f"Imported {import_sessions(store, args.path)} session(s) from {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import base64
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+from PIL import Image
+
+BLOB_DIR = os.path.join("data", "blobs")
+THUMB_WIDTH = 300
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+# --------------------
+# Content-addressed blob store
+# --------------------
+class BlobStore:
+    """
+    Stores uploaded files on disk under their SHA-256 digest.
+    Identical uploads share one file; thumbnails are rendered on first use.
+    """
+
+    def __init__(self, root=BLOB_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def put(self, data):
+        """Stores the original bytes and returns their hex digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        return digest
+
+    def path(self, digest):
+        if not _DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def get(self, digest):
+        with open(self.path(digest), "rb") as f:
+            return f.read()
+
+    def open_image(self, digest):
+        return Image.open(self.path(digest))
+
+    def thumbnail(self, digest, width=THUMB_WIDTH):
+        """Returns the path of a downscaled copy, rendering it if needed."""
+        thumb_path = os.path.join(self.root, "thumbs", digest[:2], f"{digest}_{width}")
+        if os.path.exists(thumb_path):
+            return thumb_path
+        with self.open_image(digest) as image:
+            image.thumbnail((width, width * 4))
+            has_alpha = image.mode in ("RGBA", "LA", "P")
+            if not has_alpha and image.mode != "RGB":
+                image = image.convert("RGB")
+            buffered = io.BytesIO()
+            if has_alpha:
+                image.save(buffered, format="PNG", optimize=True)
+            else:
+                image.save(buffered, format="JPEG", quality=85)
+        _write_atomic(thumb_path, buffered.getvalue())
+        return thumb_path
+
+    def thumbnail_bytes(self, digest, width=THUMB_WIDTH):
+        with open(self.thumbnail(digest, width), "rb") as f:
+            return f.read()
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# --------------------
+# Legacy inline images
+# --------------------
+def externalize_inline_images(sessions, blobs):
+    """Moves base64 "image" fields of legacy sessions into the blob store, in place."""
+    for session in sessions.values():
+        for message in session.get("messages", []):
+            if "image" in message:
+                message["image_ref"] = blobs.put(base64.b64decode(message.pop("image")))
+    return sessions
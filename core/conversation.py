@@ -0,0 +1,141 @@
+import requests
+
+DEFAULT_CONTEXT_CONFIG = {
+    "system_prompt": "You are a helpful assistant.",
+    "max_history_tokens": 2048,
+    "summary_tokens": 256,
+}
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant.
+Keep names, numbers, decisions and open questions. Answer with the summary only.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}"""
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+# --------------------
+# Prompts
+# --------------------
+def ocr_analysis_prompt(extracted_text):
+    return f"""I've uploaded an image. Here's the text extracted from it:
+
+{extracted_text}
+
+Please analyze this image by:
+1. Explaining what the extracted text means
+2. Describing what type of document or image this appears to be
+3. Providing any insights or summary about the content."""
+
+
+def document_analysis_prompt(summaries):
+    parts = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, start=1))
+    return f"""I've uploaded a long document. It was read in parts; here is a summary of each part, in reading order:
+
+{parts}
+
+Please analyze this document by:
+1. Explaining what the document says overall
+2. Describing what type of document this appears to be
+3. Providing any key facts, figures or insights from the content."""
+
+
+def message_text(message):
+    """Text the model sees for a stored message."""
+    if message.get("ocr_text"):
+        return f"[Uploaded image. Extracted text:]\n{message['ocr_text']}"
+    return message.get("content", "")
+
+
+# --------------------
+# History window
+# --------------------
+def history_messages(session, before_id=None):
+    """Messages not yet folded into the summary and older than before_id, oldest first."""
+    history = []
+    for message in session["messages"]:
+        message_id = message.get("id", 0)
+        if message_id <= session.get("summary_until", 0):
+            continue
+        if before_id is not None and message_id >= before_id:
+            break
+        if message.get("status") or message.get("error"):
+            continue  # a reply that is still queued or streaming, or that failed
+        text = message_text(message)
+        if text:
+            history.append({"role": message["role"], "content": text, "id": message_id})
+    return history
+
+
+def summarize(client, summary, messages, settings, owner=None):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=transcript)
+    return client.chat(
+        [{"role": "user", "content": prompt}],
+        options={"num_predict": settings["summary_tokens"]},
+        owner=owner,
+    ).strip()
+
+
+def build_turn(session, prompt, settings, before_id=None, client=None, owner=None):
+    """
+    Builds the /api/chat message list for a new prompt within the token budget.
+
+    When the history no longer fits, the oldest messages are folded into the
+    session's rolling summary until only half the budget is used. Folding in
+    large steps keeps the prompt prefix (system + summary + older turns)
+    identical across many subsequent turns, so Ollama can reuse its cached KV
+    state instead of re-evaluating the conversation every time.
+
+    A prompt that alone fills the budget (a long OCR text, say) is sent with
+    no history at all rather than folding everything into the summary. The
+    assistant's opening greeting is dropped, never folded.
+
+    The summary request waits in owner's queue of the router (see OllamaRouter).
+    Returns (messages, summarized); summarized is True when session["summary"]
+    and session["summary_until"] were updated and should be persisted.
+    """
+    budget = settings["max_history_tokens"] - estimate_tokens(prompt)
+    if budget <= 0:
+        return [{"role": "system", "content": settings["system_prompt"]}, {"role": "user", "content": prompt}], False
+
+    history = history_messages(session, before_id)
+    used = estimate_tokens(session.get("summary", "")) + sum(estimate_tokens(m["content"]) for m in history)
+
+    summarized = False
+    if used > budget and client is not None:
+        folded = []
+        greeting = not session.get("summary_until")  # nothing folded yet, so history starts at the greeting
+        while history and used > budget // 2:
+            message = history.pop(0)
+            used -= estimate_tokens(message["content"])
+            greeting = greeting and message["role"] != "user"
+            if not greeting:
+                folded.append(message)
+        if folded:
+            from .router import NoBackendError  # router imports this module
+            try:
+                session["summary"] = summarize(client, session.get("summary", ""), folded, settings, owner)
+                session["summary_until"] = folded[-1]["id"]
+                summarized = True
+            except (requests.RequestException, NoBackendError):
+                pass  # the folded messages are simply dropped for this turn
+            used = estimate_tokens(session.get("summary", "")) + sum(estimate_tokens(m["content"]) for m in history)
+
+    while history and used > budget:
+        used -= estimate_tokens(history.pop(0)["content"])
+
+    system = settings["system_prompt"]
+    if session.get("summary"):
+        system += f"\n\nSummary of the earlier conversation:\n{session['summary']}"
+    messages = [{"role": "system", "content": system}]
+    messages += [{"role": m["role"], "content": m["content"]} for m in history]
+    messages.append({"role": "user", "content": prompt})
+    return messages, summarized
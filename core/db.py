@@ -0,0 +1,34 @@
+"""SQLite helpers shared by the session store and the OCR and response caches."""
+import sqlite3
+from contextlib import contextmanager
+
+
+@contextmanager
+def connect(path, *pragmas):
+    """Autocommit connection (transactions are begun explicitly) with the given PRAGMAs applied, closed on exit."""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        for pragma in pragmas:
+            conn.execute(f"PRAGMA {pragma}")
+        yield conn
+    finally:
+        conn.close()
+
+
+def evict_lru(conn, table, max_bytes, keep_key):
+    """
+    Deletes least-recently-used rows of table (with key, size and last_used
+    columns) until its total size fits max_bytes; keep_key is never evicted.
+    Call inside the write transaction that added keep_key.
+    """
+    total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+    if total <= max_bytes:
+        return
+    evicted = 0
+    for old_key, old_size in conn.execute(
+        f"SELECT key, size FROM {table} WHERE key != ? ORDER BY last_used", (keep_key,)
+    ).fetchall():
+        if total - evicted <= max_bytes:
+            break
+        conn.execute(f"DELETE FROM {table} WHERE key = ?", (old_key,))
+        evicted += old_size
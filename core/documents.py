@@ -0,0 +1,127 @@
+"""
+Long scanned documents: layout-aware chunking of OCR blocks and map-reduce
+summarization, so a dense document reaches the model as a few bounded
+summaries instead of one prompt that overflows its context.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from .conversation import document_analysis_prompt, estimate_tokens
+from .metrics import span
+from .ocr import layout_text
+
+CHUNK_PROMPT = """Summarize part {part} of {parts} of a scanned document.
+Keep headings, names, numbers, dates and amounts. Answer with the summary only.
+
+{text}"""
+
+
+# --------------------
+# Chunking
+# --------------------
+def chunk_pages(pages, max_tokens):
+    """
+    Splits OCR layout into chunks of at most about max_tokens.
+
+    pages is a list of (label, blocks); label (e.g. "report.pdf p. 2") is
+    written above the first text of its page and may be None. Blocks are
+    never split unless one alone exceeds the budget, in which case it is
+    split between lines. Returns the chunk texts in reading order.
+    """
+    chunks, current, used = [], [], 0
+    for label, blocks in pages:
+        pieces = [layout_text([block]) for block in blocks]
+        if label and pieces:
+            pieces[0] = f"--- {label} ---\n{pieces[0]}"
+        for piece in pieces:
+            for part in _split_lines(piece, max_tokens):
+                tokens = estimate_tokens(part)
+                if current and used + tokens > max_tokens:
+                    chunks.append("\n\n".join(current))
+                    current, used = [], 0
+                current.append(part)
+                used += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _split_lines(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    parts, current = [], []
+    for line in text.split("\n"):
+        if current and estimate_tokens("\n".join(current + [line])) > max_tokens:
+            parts.append("\n".join(current))
+            current = []
+        current.append(line)
+    parts.append("\n".join(current))
+    return parts
+
+
+# --------------------
+# Map-reduce summaries
+# --------------------
+def summarize_document(client, chunks, settings, progress=None, owner=None, task=None):
+    """
+    Summarizes every chunk on its own, with at most settings["max_concurrency"]
+    requests to Ollama at a time, and merges the summaries in rounds until
+    they fit one chunk budget together. Returns the final summaries in
+    reading order; progress(done, total) is called after each request.
+    The requests wait in owner's queue of the router and take task's route.
+    """
+    summaries = chunks
+    with ThreadPoolExecutor(max_workers=max(1, settings["max_concurrency"])) as pool:
+        while True:
+            summaries = _summarize_all(client, pool, summaries, settings, progress, owner, task)
+            if len(summaries) == 1 or estimate_tokens("\n\n".join(summaries)) <= settings["chunk_tokens"]:
+                return summaries
+            summaries = _merge(summaries, settings["chunk_tokens"])
+
+
+def _summarize_all(client, pool, texts, settings, progress, owner, task):
+    def summarize(item):
+        part, text = item
+        prompt = CHUNK_PROMPT.format(part=part, parts=len(texts), text=text)
+        with span("summarize_chunk"):
+            return client.chat(
+                [{"role": "user", "content": prompt}],
+                options={"num_predict": settings["chunk_summary_tokens"]},
+                owner=owner,
+                task=task,
+            ).strip()
+
+    summaries = []
+    for done, summary in enumerate(pool.map(summarize, enumerate(texts, start=1)), start=1):
+        summaries.append(summary)
+        if progress is not None:
+            progress(done, len(texts))
+    return summaries
+
+
+def _merge(summaries, max_tokens):
+    # at least two per group, so every round halves the count and the loop ends
+    groups, current = [], []
+    for summary in summaries:
+        if len(current) >= 2 and estimate_tokens("\n\n".join(current + [summary])) > max_tokens:
+            groups.append("\n\n".join(current))
+            current = []
+        current.append(summary)
+    groups.append("\n\n".join(current))
+    return groups
+
+
+def document_preparer(client, chunks, settings):
+    """
+    A JobManager prepare step: summarizes the chunks on the reply's worker,
+    in its user's queue and on its task's route, reporting progress on the
+    job, and returns the analysis prompt.
+    """
+    def prepare(job):
+        def progress(done, total):
+            job.progress = f"Summarizing document: {done} of {total} parts"
+
+        return document_analysis_prompt(
+            summarize_document(client, chunks, settings, progress, job.store.path, job.task)
+        )
+
+    return prepare
@@ -0,0 +1,187 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from .conversation import build_turn
+from .metrics import record_reply, span
+from .response_cache import replay_chunks
+from .streaming import ReplyStream
+
+QUEUED = "queued"
+STREAMING = "streaming"
+STALE_AFTER = 300  # seconds without a write after which a placeholder with no live job is considered dead
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------
+# Generation jobs
+# --------------------
+class GenerationJob:
+    def __init__(self, store, chat_id, prompt, message, before_id, settings, prepare=None, task=None):
+        self.store = store  # the SessionStore of the user who owns the chat
+        self.chat_id = chat_id
+        self.prompt = prompt
+        self.prepare = prepare  # optional callable(job) -> prompt, run on the worker first
+        self.progress = None  # what a slow prepare step is doing, for display
+        self.task = task  # kind of request for model routing, e.g. "ocr"
+        self.message = message  # the assistant placeholder, updated in place
+        self.before_id = before_id
+        self.settings = settings
+        self.stream = None
+        self.done = threading.Event()
+
+    @property
+    def status(self):
+        return self.message.get("status")
+
+
+class JobManager:
+    """
+    Runs replies on background threads so Streamlit reruns never cut them off.
+    Each chat has its own FIFO queue drained by one worker thread, so turns
+    within a chat stay in order while different chats generate concurrently.
+    Partial output is written to the chat's store every `persist_interval`
+    seconds. One manager serves every user; each job carries its own store.
+    With a ResponseCache, repeated turns are replayed from it instead of
+    being generated again. client is an OllamaRouter, which picks the model
+    for each job and queues it fairly against other users' jobs.
+    """
+
+    def __init__(self, client, cache=None, persist_interval=0.5):
+        self.client = client
+        self.cache = cache
+        self.persist_interval = persist_interval
+        self._lock = threading.Lock()
+        self._queues = {}  # (store path, chat id) -> deque of jobs
+        self._jobs = {}  # (store path, assistant message id) -> job; row ids repeat across users' stores
+
+    def submit(self, store, chat_id, prompt, before_id, settings, prepare=None, task=None):
+        """
+        Reserves an assistant message right after the current turn and queues
+        its generation. Returns the placeholder message (status "queued").
+        With prepare, the prompt is whatever prepare(job) returns when the job
+        starts, for prompts that need their own model calls (long documents).
+        task selects a model route of the router (see OllamaRouter.route).
+        """
+        message = {"role": "assistant", "content": "", "status": QUEUED, "time": datetime.now().isoformat()}
+        store.append_message(chat_id, message)
+        job = GenerationJob(store, chat_id, prompt, message, before_id, settings, prepare, task)
+        key = (store.path, chat_id)
+        with self._lock:
+            self._jobs[store.path, message["id"]] = job
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque()
+                threading.Thread(target=self._drain, args=(key, queue), daemon=True).start()
+            queue.append(job)
+        return message
+
+    def recover(self, store):
+        """
+        Ends the reply placeholders of store left "queued" or "streaming" by
+        a process that died: those with no job here and no write for
+        STALE_AFTER seconds. Returns how many were marked interrupted.
+        """
+        with self._lock:
+            live = {message_id for path, message_id in self._jobs if path == store.path}
+        cutoff = (datetime.now() - timedelta(seconds=STALE_AFTER)).isoformat()
+        return store.recover_interrupted(cutoff, live)
+
+    def get(self, store, message_id):
+        """The live job generating message_id in store, or None."""
+        return self._jobs.get((store.path, message_id))
+
+    def active(self, store, chat_id=None):
+        """Live jobs of store, optionally only those of one chat."""
+        with self._lock:
+            return [
+                job for (path, _), job in self._jobs.items()
+                if path == store.path and (chat_id is None or job.chat_id == chat_id)
+            ]
+
+    def _drain(self, key, queue):
+        try:
+            while True:
+                with self._lock:
+                    if not queue:
+                        del self._queues[key]
+                        return
+                    job = queue.popleft()
+                try:
+                    self._run(job)
+                except Exception:
+                    # e.g. "database is locked" while persisting; the chat's later replies must still run
+                    logger.exception("Reply %s of chat %s failed", job.message.get("id"), job.chat_id)
+                finally:
+                    with self._lock:
+                        self._jobs.pop((job.store.path, job.message["id"]), None)
+                    job.done.set()
+        finally:
+            with self._lock:
+                if self._queues.get(key) is queue:  # this thread is dying with its queue still registered
+                    if queue:
+                        threading.Thread(target=self._drain, args=(key, queue), daemon=True).start()
+                    else:
+                        del self._queues[key]
+
+    def _run(self, job):
+        message = job.message
+        message["status"] = STREAMING
+        job.stream = ReplyStream(lambda stream: self._persist(job), interval=self.persist_interval)
+        try:
+            session = job.store.load_session(job.chat_id)
+            if session is None:
+                return  # chat was deleted while the job was queued
+            if job.prepare is not None:
+                with span("prepare_prompt"):
+                    job.prompt = job.prepare(job)
+                job.progress = None
+            with span("build_turn"):
+                messages, summarized = build_turn(
+                    session, job.prompt, job.settings, job.before_id, self.client, job.store.path
+                )
+            if summarized:
+                job.store.set_summary(job.chat_id, session["summary"], session["summary_until"])
+            model = self.client.route(messages, job.task)
+            cached, entry = self._lookup(job, messages, model)
+            if cached is not None:
+                message["cached"] = True
+            ollama_stats = {}
+            if cached is not None:
+                chunks = replay_chunks(cached)
+            else:
+                chunks = self.client.chat_stream(messages, model=model, stats=ollama_stats, owner=job.store.path)
+            job.stream.started = time.perf_counter()  # ttft counts from the request, not from prepare/build_turn
+            for chunk in chunks:
+                job.stream.add(chunk)
+            job.stream.finish()
+            message["stats"] = dict(job.stream.stats(), **ollama_stats)
+            record_reply(message["stats"], cached is not None)
+            if "⚠️ Ollama error:" in job.stream.text:
+                message["error"] = True  # kept out of later turns' history
+            elif cached is None and entry is not None and job.stream.text:
+                self.cache.put(entry, job.stream.text)
+        except Exception as e:
+            job.stream.add(f"⚠️ Generation error: {e}")
+            job.stream.finish()
+            message["error"] = True
+        message.pop("status", None)
+        self._persist(job)
+
+    def _lookup(self, job, messages, model):
+        if self.cache is None:
+            return None, None
+        try:
+            return self.cache.lookup(messages, model, self.client.options, job.store.path)
+        except sqlite3.Error:
+            return None, None  # a broken cache never blocks a reply
+
+    def _persist(self, job):
+        job.message["content"] = job.stream.text
+        job.message["updated"] = datetime.now().isoformat()  # lets recover() tell live replies from dead ones
+        with span("persist_reply"):
+            job.store.update_message(job.message["id"], job.message)
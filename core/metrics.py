@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_METRICS_CONFIG = {
+    "port": 0,  # serve Prometheus text on http://<host>:<port>/metrics; 0 = off
+    "host": "127.0.0.1",
+    "log_file": "",  # append every observation as a JSON line, e.g. "data/metrics.jsonl"
+}
+
+# Histogram bucket bounds in seconds, shared by every stage.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+# --------------------
+# Registry
+# --------------------
+class Metrics:
+    """
+    Process-wide stage timings and counters.
+    Each stage keeps Prometheus-style cumulative buckets plus its most recent
+    `window` samples for percentiles in the diagnostics panel.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._log = None
+
+    def configure(self, log_file=""):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            if log_file:
+                directory = os.path.dirname(log_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._log = open(log_file, "a", encoding="utf-8", buffering=1)
+
+    def observe(self, stage, seconds):
+        """Records one duration for stage."""
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {
+                    "count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS), "recent": deque(maxlen=self.window),
+                }
+            entry["count"] += 1
+            entry["sum"] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry["buckets"][i] += 1
+            entry["recent"].append(seconds)
+            if self._log is not None:
+                self._log.write(json.dumps({"time": time.time(), "stage": stage, "seconds": round(seconds, 6)}) + "\n")
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def span(self, stage):
+        """Times the enclosed block as one observation of stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def summary(self):
+        """Rows for the diagnostics panel: one per stage with count, mean, p50, p95 and last, in ms."""
+        with self._lock:
+            stages = {stage: (entry["count"], entry["sum"], sorted(entry["recent"]), entry["recent"][-1])
+                      for stage, entry in self._stages.items()}
+        rows = []
+        for stage, (count, total, recent, last) in sorted(stages.items()):
+            rows.append({
+                "stage": stage,
+                "count": count,
+                "mean ms": round(total / count * 1000, 1),
+                "p50 ms": round(recent[len(recent) // 2] * 1000, 1),
+                "p95 ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1),
+                "last ms": round(last * 1000, 1),
+            })
+        return rows
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def prometheus_text(self):
+        """Current values in the Prometheus text exposition format."""
+        lines = [
+            "# HELP ocrchat_stage_seconds Time spent per pipeline stage.",
+            "# TYPE ocrchat_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, entry in sorted(self._stages.items()):
+                for bound, cumulative in zip(BUCKETS, entry["buckets"]):
+                    lines.append(f'ocrchat_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'ocrchat_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {entry["count"]}')
+                lines.append(f'ocrchat_stage_seconds_sum{{stage="{stage}"}} {entry["sum"]:.6f}')
+                lines.append(f'ocrchat_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE ocrchat_{name}_total counter")
+                lines.append(f"ocrchat_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def span(stage):
+    return METRICS.span(stage)
+
+
+def record_reply(stats, cached=False):
+    """Records the timings of one finished reply (a message "stats" dict)."""
+    METRICS.count("replies")
+    if cached:
+        METRICS.count("response_cache_hits")
+        return
+    if stats.get("ttft") is not None:
+        METRICS.observe("ttft", stats["ttft"])
+    for field, stage in (("load_duration", "ollama_load"), ("prompt_eval_duration", "ollama_prompt_eval"),
+                         ("eval_duration", "ollama_eval"), ("total_duration", "ollama_total")):
+        if field in stats:
+            METRICS.observe(stage, stats[field])
+    for field, counter in (("prompt_eval_count", "prompt_tokens"), ("eval_count", "generated_tokens")):
+        if field in stats:
+            METRICS.count(counter, stats[field])
+
+
+# --------------------
+# Prometheus endpoint
+# --------------------
+def serve_metrics(port, host="127.0.0.1", metrics=METRICS):
+    """
+    Serves GET /metrics on a daemon thread. Returns the server, or None when
+    the port is taken (e.g. by another replica on the same host).
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError:
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,337 @@
+import hashlib
+import io
+import json
+import os
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import pytesseract
+from PIL import Image
+
+from .db import connect, evict_lru
+from .metrics import METRICS
+from .preprocess import DEFAULT_PREPROCESS_CONFIG, preprocess_image
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    from pdf2image import convert_from_bytes
+except ImportError:
+    convert_from_bytes = None
+
+OCR_CACHE_FILE = os.path.join("data", "ocr_cache.db")
+DEFAULT_OCR_CONFIG = {
+    "lang": "eng",
+    "psm": 3,
+    "oem": 3,
+    "cache_max_bytes": 64 * 1024 * 1024,
+    "pdf_dpi": 200,
+    "max_workers": 0,  # 0 = one worker per available core
+    "preprocess": DEFAULT_PREPROCESS_CONFIG,
+    "layout": {
+        "enabled": False,
+        "min_confidence": 60,  # words Tesseract is less sure about (0-100) are dropped as noise
+        "chunk_tokens": 1500,  # budget of one chunk of a long document
+        "chunk_summary_tokens": 200,  # num_predict of each chunk summary
+        "max_concurrency": 2,  # chunk summaries requested from Ollama at once
+    },
+}
+
+
+
+# --------------------
+# OCR Function
+# --------------------
+def extract_text_from_image(image, lang="eng", psm=3, oem=3):
+    try:
+        extracted_text = pytesseract.image_to_string(image, lang=lang, config=f"--psm {psm} --oem {oem}")
+        return extracted_text.strip()
+    except Exception as e:
+        return f"⚠️ OCR error: {e}"
+
+
+def extract_layout(image, lang="eng", psm=3, oem=3, min_confidence=60):
+    """
+    OCRs an image into blocks in Tesseract's reading order:
+    [{"bbox", "confidence", "lines": [{"text", "bbox", "confidence"}]}],
+    with bbox as [left, top, right, bottom] in pixels and confidence 0-100.
+    Words below min_confidence are dropped, and lines or blocks left empty
+    with them. On failure, returns one block holding the error message.
+    """
+    try:
+        data = pytesseract.image_to_data(
+            image, lang=lang, config=f"--psm {psm} --oem {oem}", output_type=pytesseract.Output.DICT
+        )
+    except Exception as e:
+        return _error_layout(f"⚠️ OCR error: {e}")
+
+    blocks = {}
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if not word.strip() or confidence < max(min_confidence, 0):
+            continue  # conf is -1 for the block, paragraph and line rows themselves
+        box = [data["left"][i], data["top"][i], data["left"][i] + data["width"][i], data["top"][i] + data["height"][i]]
+        lines = blocks.setdefault(data["block_num"][i], {})
+        lines.setdefault((data["par_num"][i], data["line_num"][i]), []).append((word, box, confidence))
+
+    layout = []
+    for lines in blocks.values():
+        block_lines = [
+            {
+                "text": " ".join(word for word, _, _ in words),
+                "bbox": _union([box for _, box, _ in words]),
+                "confidence": round(sum(c for _, _, c in words) / len(words), 1),
+            }
+            for words in lines.values()
+        ]
+        confidences = [c for words in lines.values() for _, _, c in words]
+        layout.append({
+            "bbox": _union([line["bbox"] for line in block_lines]),
+            "confidence": round(sum(confidences) / len(confidences), 1),
+            "lines": block_lines,
+        })
+    return layout
+
+
+def _error_layout(message):
+    return [{"bbox": None, "confidence": None, "lines": [{"text": message, "bbox": None, "confidence": None}]}]
+
+
+def _union(boxes):
+    return [min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+
+def layout_text(blocks):
+    """Plain text of extract_layout blocks: one line per line, blocks separated by a blank line."""
+    return "\n\n".join("\n".join(line["text"] for line in block["lines"]) for block in blocks)
+
+
+def extract_text_cached(image_bytes, settings, cache=None):
+    """
+    OCRs raw image bytes, reusing a cached result when the same content was
+    already processed with the same Tesseract settings.
+    """
+    key = cache_key(image_bytes, settings)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            METRICS.count("ocr_cache_hits")
+            return cached
+    text, timings = _ocr_bytes(image_bytes, settings)
+    _record_timings(timings)
+    if cache is not None and not text.startswith("⚠️"):
+        cache.put(key, text)
+    return text
+
+
+def extract_layout_cached(image_bytes, settings, cache=None):
+    """extract_text_cached for the structured blocks of extract_layout."""
+    key = cache_key(image_bytes, settings, layout=True)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            METRICS.count("ocr_cache_hits")
+            return json.loads(cached)
+    blocks, timings = _ocr_bytes(image_bytes, settings, layout=True)
+    _record_timings(timings)
+    if cache is not None and not layout_text(blocks).startswith("⚠️"):
+        cache.put(key, json.dumps(blocks))
+    return blocks
+
+
+def _ocr_bytes(image_bytes, settings, layout=False):
+    """Returns (text, or blocks with layout, {stage: seconds}) for preprocessing and Tesseract."""
+    start = time.perf_counter()
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        prepared = preprocess_image(image, settings["preprocess"])
+        preprocessed = time.perf_counter()
+        if layout:
+            result = extract_layout(
+                prepared, settings["lang"], settings["psm"], settings["oem"], settings["layout"]["min_confidence"]
+            )
+        else:
+            result = extract_text_from_image(prepared, settings["lang"], settings["psm"], settings["oem"])
+    return result, {"ocr_preprocess": preprocessed - start, "ocr_tesseract": time.perf_counter() - preprocessed}
+
+
+def _record_timings(timings):
+    METRICS.count("ocr_pages")
+    for stage, seconds in timings.items():
+        METRICS.observe(stage, seconds)
+
+
+def cache_key(image_bytes, settings, layout=False):
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    preprocess = hashlib.sha256(json.dumps(settings["preprocess"], sort_keys=True).encode()).hexdigest()[:16]
+    key = f"{digest}:lang={settings['lang']}:psm={settings['psm']}:oem={settings['oem']}:pre={preprocess}"
+    if layout:
+        key += f":layout={settings['layout']['min_confidence']}"
+    return key
+
+
+# --------------------
+# Batch OCR
+# --------------------
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()  # app tabs and API requests run batches from several threads
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _mp_context():
+    # forking a multi-threaded process (Streamlit, uvicorn) can copy held locks into the children
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return None  # the platform default, spawn
+
+
+def _get_pool(max_workers):
+    """Returns a process pool shared across batches, resized when max_workers changes."""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)  # batches already submitted to it still finish
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=_mp_context())
+            _pool_size = max_workers
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drops pool after one of its workers died, so the next batch starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:  # another batch may have replaced it already
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _submit_pages(pages, pending, settings, layout):
+    """Returns (pool, {future: page index})."""
+    max_workers = settings.get("max_workers") or available_cores()
+    pool = _get_pool(max_workers)
+    try:
+        return pool, {pool.submit(_ocr_page, pages[index], settings, layout): index for index in pending}
+    except BrokenProcessPool:
+        _discard_pool(pool)  # broken by a worker that died during an earlier batch
+        pool = _get_pool(max_workers)
+        return pool, {pool.submit(_ocr_page, pages[index], settings, layout): index for index in pending}
+
+
+def render_pdf_pages(pdf_bytes, dpi=200):
+    """Rasterizes every page of a PDF into PNG bytes."""
+    if fitz is not None:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as document:
+            return [page.get_pixmap(dpi=dpi).tobytes("png") for page in document]
+    if convert_from_bytes is not None:
+        pages = []
+        for image in convert_from_bytes(pdf_bytes, dpi=dpi):
+            buffered = io.BytesIO()
+            image.save(buffered, format="PNG")
+            pages.append(buffered.getvalue())
+        return pages
+    raise RuntimeError("PDF support requires PyMuPDF (pip install pymupdf) or pdf2image")
+
+
+def _ocr_page(image_bytes, settings, layout=False):
+    # runs in a worker process, so timings go back to the parent to be recorded
+    return _ocr_bytes(image_bytes, settings, layout)
+
+
+def iter_batch_ocr(pages, settings, cache=None, layout=False):
+    """
+    OCRs a list of image bytes on a process pool.
+    Yields (index, text) in page order, each as soon as it and every
+    earlier page have finished. With layout, yields extract_layout blocks
+    instead of text.
+    """
+    results = {}
+    pending = []
+    for index, image_bytes in enumerate(pages):
+        cached = cache.get(cache_key(image_bytes, settings, layout)) if cache is not None else None
+        if cached is None:
+            pending.append(index)
+        else:
+            METRICS.count("ocr_cache_hits")
+            results[index] = json.loads(cached) if layout else cached
+
+    next_index = 0
+    if pending:
+        pool, futures = _submit_pages(pages, pending, settings, layout)
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result, timings = future.result()
+                _record_timings(timings)
+            except BrokenProcessPool as e:
+                _discard_pool(pool)
+                result = _error_layout(f"⚠️ OCR error: {e}") if layout else f"⚠️ OCR error: {e}"
+            except Exception as e:
+                result = _error_layout(f"⚠️ OCR error: {e}") if layout else f"⚠️ OCR error: {e}"
+            text = layout_text(result) if layout else result
+            if cache is not None and not text.startswith("⚠️"):
+                cache.put(cache_key(pages[index], settings, layout), json.dumps(result) if layout else result)
+            results[index] = result
+            while next_index in results:
+                yield next_index, results.pop(next_index)
+                next_index += 1
+    while next_index in results:
+        yield next_index, results.pop(next_index)
+        next_index += 1
+
+
+# --------------------
+# Persistent OCR cache
+# --------------------
+class OcrCache:
+    """
+    SQLite-backed OCR results, evicted least-recently-used beyond max_bytes.
+    journal_mode follows storage.journal_mode (WAL is unsafe on network filesystems).
+    """
+
+    def __init__(self, path=OCR_CACHE_FILE, max_bytes=DEFAULT_OCR_CONFIG["cache_max_bytes"], journal_mode="wal"):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(f"PRAGMA journal_mode={journal_mode}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ocr_cache_lru ON ocr_cache(last_used)")
+
+    def _connect(self):
+        return connect(self.path)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE ocr_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, text):
+        size = len(key) + len(text.encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            evict_lru(conn, "ocr_cache", self.max_bytes, key)
+            conn.execute("COMMIT")
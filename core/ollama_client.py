@@ -0,0 +1,141 @@
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_OLLAMA_CONFIG = {
+    "host": "http://localhost:11434",
+    "model": "llama2:latest",
+    "options": {"num_predict": 200},
+    "keep_alive": "30m",
+    "connect_timeout": 5,
+    "read_timeout": 120,
+    "pool_size": 10,
+}
+
+
+def generation_stats(chunk):
+    """Ollama's counters and timings from a final ("done") chunk, durations in seconds."""
+    stats = {}
+    for field in ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration"):
+        if chunk.get(field) is not None:
+            stats[field] = round(chunk[field] / 1e9, 3)  # nanoseconds
+    for field in ("prompt_eval_count", "eval_count"):
+        if chunk.get(field) is not None:
+            stats[field] = chunk[field]
+    return stats
+
+
+# --------------------
+# Ollama client
+# --------------------
+class OllamaClient:
+    """
+    Thin Ollama HTTP client sharing one keep-alive connection pool.
+    keep_alive is sent with every request so the model stays loaded between turns.
+    """
+
+    def __init__(self, host=DEFAULT_OLLAMA_CONFIG["host"], model=DEFAULT_OLLAMA_CONFIG["model"], options=None,
+                 keep_alive=DEFAULT_OLLAMA_CONFIG["keep_alive"], connect_timeout=5, read_timeout=120, pool_size=10):
+        self.host = host.rstrip("/")
+        self.model = model
+        self.options = dict(options or {})
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_config(cls, config):
+        from .services import section  # services imports this module
+        settings = section(config, "ollama", DEFAULT_OLLAMA_CONFIG)
+        return cls(
+            host=settings["host"],
+            model=settings["model"],
+            options=settings["options"],
+            keep_alive=settings["keep_alive"],
+            connect_timeout=settings["connect_timeout"],
+            read_timeout=settings["read_timeout"],
+            pool_size=settings["pool_size"],
+        )
+
+    def _payload(self, model, options, **fields):
+        payload = {"model": model or self.model, **fields}
+        merged = dict(self.options, **(options or {}))
+        if merged:
+            payload["options"] = merged
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def _stream(self, path, payload):
+        """Yields the decoded NDJSON chunks of a streaming endpoint."""
+        with self.session.post(f"{self.host}{path}", json=payload, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if line:
+                    try:
+                        yield json.loads(line.decode("utf-8"))
+                    except json.JSONDecodeError:
+                        continue
+
+    def chat_chunks(self, messages, model=None, options=None):
+        """Raw NDJSON chunks of a streaming /api/chat call; raises on failure."""
+        return self._stream("/api/chat", self._payload(model, options, messages=messages, stream=True))
+
+    def chat_stream(self, messages, model=None, options=None, stats=None):
+        """
+        Streaming response from /api/chat for a list of {"role", "content"} messages.
+        Yields text chunks as they are generated. If a stats dict is given, it
+        receives generation_stats() of the final chunk.
+        """
+        try:
+            for chunk in self.chat_chunks(messages, model, options):
+                if chunk.get("done") and stats is not None:
+                    stats.update(generation_stats(chunk))
+                yield chunk.get("message", {}).get("content") or ""
+        except Exception as e:
+            yield f"⚠️ Ollama error: {e}"
+
+    def chat(self, messages, model=None, options=None, owner=None, task=None):
+        """
+        Non-streaming /api/chat call. Returns the reply text; raises on failure.
+        owner and task only matter to OllamaRouter and are ignored here.
+        """
+        payload = self._payload(model, options, messages=messages, stream=False)
+        r = self.session.post(f"{self.host}/api/chat", json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json().get("message", {}).get("content", "")
+
+    def embed(self, texts, model=None, owner=None):
+        """Embedding vectors from /api/embed, one per input text. Raises on failure; owner is ignored."""
+        payload = {"model": model or self.model, "input": list(texts)}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        r = self.session.post(f"{self.host}/api/embed", json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json().get("embeddings", [])
+
+    def ping(self):
+        """True when the server answers /api/tags."""
+        try:
+            r = self.session.get(f"{self.host}/api/tags", timeout=(self.timeout[0], self.timeout[0]))
+            return r.ok
+        except requests.RequestException:
+            return False
+
+    def preload(self, model=None):
+        """Loads the model into memory in the background so the first turn starts warm."""
+        payload = self._payload(model, None)
+        payload.pop("options", None)
+
+        def run():
+            try:
+                self.session.post(f"{self.host}/api/generate", json=payload, timeout=self.timeout).close()
+            except requests.RequestException:
+                pass
+
+        threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,139 @@
+import numpy as np
+from PIL import Image
+
+DEFAULT_PREPROCESS_CONFIG = {
+    "enabled": True,
+    "roi": None,  # [left, top, right, bottom] as fractions of the image, e.g. [0, 0.5, 1, 1]
+    "target_dpi": 300,
+    "max_side": 2500,
+    "grayscale": True,
+    "deskew": True,
+    "binarize": True,
+}
+
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+# --------------------
+# Geometry
+# --------------------
+def crop_roi(image, roi):
+    """Crops to a region given as fractions (left, top, right, bottom)."""
+    left, top, right, bottom = roi
+    width, height = image.size
+    box = (int(left * width), int(top * height), int(right * width), int(bottom * height))
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return image
+    return image.crop(box)
+
+
+def dpi_scale(image, target_dpi):
+    """Scale factor that brings the embedded DPI to target_dpi (at most 2x up)."""
+    dpi = image.info.get("dpi")
+    if not dpi or not dpi[0]:
+        return 1.0
+    return min(target_dpi / float(dpi[0]), 2.0)
+
+
+def rescale(image, scale):
+    if abs(scale - 1.0) < 0.01:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def limit_size(image, max_side):
+    """Downscales so the longest side is at most max_side pixels."""
+    return rescale(image, min(1.0, max_side / max(image.size)))
+
+
+# --------------------
+# Pixel operations (NumPy)
+# --------------------
+def to_grayscale(image):
+    if image.mode == "L":
+        return image
+    rgb = np.asarray(image.convert("RGB"), dtype=np.float32)
+    gray = rgb @ _LUMA
+    return Image.fromarray(np.clip(gray, 0, 255).astype(np.uint8), mode="L")
+
+
+def adaptive_binarize(image, window=31, k=0.2):
+    """
+    Sauvola thresholding: each pixel is compared against the mean and
+    standard deviation of its window, computed with integral images.
+    """
+    gray = np.asarray(image.convert("L"), dtype=np.float64)
+    half = window // 2
+    padded = np.pad(gray, half + 1, mode="edge")
+    integral = padded.cumsum(0).cumsum(1)
+    integral_sq = (padded * padded).cumsum(0).cumsum(1)
+
+    height, width = gray.shape
+
+    def window_sum(table):
+        return (
+            table[window:window + height, window:window + width]
+            - table[:height, window:window + width]
+            - table[window:window + height, :width]
+            + table[:height, :width]
+        )
+
+    area = float(window * window)
+    mean = window_sum(integral) / area
+    variance = np.maximum(window_sum(integral_sq) / area - mean * mean, 0.0)
+    threshold = mean * (1.0 + k * (np.sqrt(variance) / 128.0 - 1.0))
+    return Image.fromarray(np.where(gray > threshold, 255, 0).astype(np.uint8), mode="L")
+
+
+def estimate_skew(image, max_angle=5.0, step=0.5, sample_side=800):
+    """
+    Finds the rotation (degrees) that makes text rows most distinct, by
+    maximizing the variance of the horizontal projection profile.
+    """
+    sample = limit_size(image.convert("L"), sample_side)
+    inverted = Image.fromarray(255 - np.asarray(sample), mode="L")
+
+    def profile_score(angle):
+        rotated = np.asarray(inverted.rotate(angle, resample=Image.BILINEAR, fillcolor=0), dtype=np.float32)
+        return float(np.var(rotated.sum(axis=1)))
+
+    best_angle, best_score = 0.0, profile_score(0.0)
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        score = profile_score(float(angle))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(image):
+    angle = estimate_skew(image)
+    if abs(angle) < 0.1:
+        return image
+    fill = 255 if image.mode == "L" else (255, 255, 255)
+    return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+
+# --------------------
+# Pipeline
+# --------------------
+def preprocess_image(image, options):
+    """Runs the enabled steps in order: crop, DPI, downscale, grayscale, deskew, binarize."""
+    if not options.get("enabled", True):
+        return image
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if options.get("roi"):
+        image = crop_roi(image, options["roi"])
+    # DPI normalization and downscaling are folded into a single resize.
+    scale = dpi_scale(image, options["target_dpi"]) if options.get("target_dpi") else 1.0
+    if options.get("max_side"):
+        scale = min(scale, options["max_side"] / max(image.size))
+    image = rescale(image, scale)
+    if options.get("grayscale") or options.get("binarize"):
+        image = to_grayscale(image)
+    if options.get("deskew"):
+        image = deskew(image)
+    if options.get("binarize"):
+        image = adaptive_binarize(image)
+    return image
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from .db import connect, evict_lru
+
+RESPONSE_CACHE_FILE = os.path.join("data", "response_cache.db")
+
+DEFAULT_RESPONSE_CACHE_CONFIG = {
+    "enabled": True,
+    "ttl_seconds": 7 * 24 * 3600,
+    "max_bytes": 32 * 1024 * 1024,
+    "semantic": False,  # also serve close paraphrases, using Ollama embeddings
+    "embed_model": "nomic-embed-text",
+    "similarity": 0.95,  # minimum cosine similarity for a near-duplicate hit
+}
+
+
+def normalize_prompt(text):
+    """Case- and whitespace-insensitive form of a prompt."""
+    return " ".join(text.split()).casefold()
+
+
+def turn_key(messages, model, options):
+    """
+    Cache identity of an /api/chat turn as (key, partition).
+
+    partition hashes everything except the new prompt: model, options, system
+    prompt and the conversation from the first user message on (the
+    assistant's opening greeting is left out so fresh chats share answers).
+    key adds the normalized prompt.
+    """
+    *context, prompt = messages
+    first_user = next((i for i, m in enumerate(context) if m["role"] == "user"), len(context))
+    context = [m for m in context[:1] if m["role"] == "system"] + context[first_user:]
+    partition = hashlib.sha256(
+        json.dumps([model, options or {}, [[m["role"], normalize_prompt(m["content"])] for m in context]],
+                   sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    key = hashlib.sha256(f"{partition}:{normalize_prompt(prompt['content'])}".encode("utf-8")).hexdigest()
+    return key, partition
+
+
+def replay_chunks(text):
+    """Splits a cached reply into word-sized chunks so it plays back like a streamed one."""
+    return re.findall(r"\s*\S+|\s+", text)
+
+
+# --------------------
+# Response cache
+# --------------------
+class ResponseCache:
+    """
+    SQLite-backed replies to earlier turns.
+    Entries expire after ttl_seconds and are evicted least-recently-used
+    beyond max_bytes. With semantic lookups enabled, a miss falls back to the
+    most similar stored prompt in the same partition and for the same owner,
+    so paraphrased answers are never shared between users.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, settings=None, embed=None, journal_mode="wal"):
+        self.path = path
+        self.settings = dict(DEFAULT_RESPONSE_CACHE_CONFIG, **(settings or {}))
+        self.embed = embed  # embed(text) -> vector; needed for semantic lookups
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(f"PRAGMA journal_mode={journal_mode}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, partition TEXT NOT NULL, owner TEXT NOT NULL, response TEXT NOT NULL, "
+                "embedding BLOB, size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_used)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_by_partition ON responses(partition, owner)")
+
+    def _connect(self):
+        return connect(self.path)
+
+    def lookup(self, messages, model, options, owner):
+        """
+        Returns (reply or None, entry). Pass entry to put() after generating a
+        reply on a miss; it carries the key and, if computed, the embedding.
+        """
+        key, partition = turn_key(messages, model, options)
+        entry = {"key": key, "partition": partition, "owner": owner, "embedding": None}
+        now = time.time()
+        oldest = now - self.settings["ttl_seconds"]
+        with self._connect() as conn:
+            row = conn.execute("SELECT response FROM responses WHERE key = ? AND created >= ?", (key, oldest)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                return row[0], entry
+            if not (self.settings["semantic"] and self.embed):
+                return None, entry
+            try:
+                entry["embedding"] = np.asarray(self.embed(normalize_prompt(messages[-1]["content"])), dtype=np.float32)
+            except Exception:
+                return None, entry  # embedding model unavailable; exact matches still work
+            candidates = conn.execute(
+                "SELECT key, response, embedding FROM responses "
+                "WHERE partition = ? AND owner = ? AND embedding IS NOT NULL AND created >= ?",
+                (partition, owner, oldest),
+            ).fetchall()
+        best_key, best_reply, best_score = None, None, self.settings["similarity"]
+        for candidate_key, reply, blob in candidates:
+            score = _cosine(entry["embedding"], np.frombuffer(blob, dtype=np.float32))
+            if score >= best_score:
+                best_key, best_reply, best_score = candidate_key, reply, score
+        if best_key is not None:
+            with self._connect() as conn:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, best_key))
+        return best_reply, entry
+
+    def put(self, entry, response):
+        embedding = entry["embedding"].tobytes() if entry.get("embedding") is not None else None
+        size = len(entry["key"]) + len(response.encode("utf-8")) + len(embedding or b"")
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.settings["ttl_seconds"],))
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, partition, owner, response, embedding, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry["key"], entry["partition"], entry["owner"], response, embedding, size, now, now),
+            )
+            evict_lru(conn, "responses", self.settings["max_bytes"], entry["key"])
+            conn.execute("COMMIT")
+
+
+def _cosine(a, b):
+    if a.shape != b.shape:
+        return 0.0  # stored with a different embedding model
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / norm if norm else 0.0
@@ -0,0 +1,286 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+
+from .conversation import estimate_tokens
+from .metrics import METRICS
+from .ollama_client import DEFAULT_OLLAMA_CONFIG, OllamaClient, generation_stats
+
+DEFAULT_ROUTER_CONFIG = {
+    "backends": [],  # [{"name", "host", "models", "max_concurrency"}]; empty = the "ollama" host alone
+    "max_concurrency": 2,  # requests in flight per backend, unless the backend sets its own
+    "routes": {"short": "", "ocr": ""},  # model per kind of request; empty = the "ollama" model
+    "short_prompt_tokens": 64,  # prompts up to this size take the "short" route
+    "queue_timeout": 300,  # seconds a request may wait for a free backend
+    "health_interval": 15,  # seconds between /api/tags checks of every backend; 0 = off
+}
+
+
+class NoBackendError(RuntimeError):
+    """Every backend serving the model failed this request, or none became free within queue_timeout."""
+
+
+class Backend:
+    """One Ollama server: its client, the models it serves and how many requests it takes at once."""
+
+    def __init__(self, name, client, models=(), max_concurrency=2):
+        self.name = name
+        self.client = client
+        self.models = list(models)  # empty = whatever it is asked for
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.healthy = True
+        self.active = 0
+
+
+# --------------------
+# Router
+# --------------------
+class OllamaRouter:
+    """
+    Spreads requests over several Ollama backends with the OllamaClient
+    interface. Each backend runs at most max_concurrency requests; the rest
+    wait in one queue per owner (the user's store), served round-robin so a
+    busy user cannot starve the others. Backends that refuse connections are
+    taken out until the health check, or a request that reaches them anyway
+    when no healthy backend is left, sees them answer again; a request that
+    fails before its first chunk is retried on another backend.
+    route() picks the model: a task's own route, the "short" route for short
+    prompts, else the default model.
+    """
+
+    def __init__(self, backends, model, options=None, routes=None, short_prompt_tokens=64, queue_timeout=300,
+                 health_interval=15):
+        self.backends = list(backends)
+        self.model = model
+        self.options = dict(options or {})
+        self.routes = {task: name for task, name in (routes or {}).items() if name}
+        self.short_prompt_tokens = short_prompt_tokens
+        self.queue_timeout = queue_timeout
+        self.health_interval = health_interval
+        self._cond = threading.Condition()
+        self._waiting = OrderedDict()  # owner -> deque of waiting requests, in round-robin order
+        if health_interval and health_interval > 0:
+            threading.Thread(target=self._watch, daemon=True).start()
+
+    @classmethod
+    def from_config(cls, config):
+        from .services import section  # services imports this module
+        ollama = section(config, "ollama", DEFAULT_OLLAMA_CONFIG)
+        settings = section(config, "router", DEFAULT_ROUTER_CONFIG)
+        backends = []
+        for spec in settings["backends"] or [{"host": ollama["host"]}]:
+            client = OllamaClient(
+                host=spec.get("host", ollama["host"]),
+                model=ollama["model"],
+                options=ollama["options"],
+                keep_alive=ollama["keep_alive"],
+                connect_timeout=ollama["connect_timeout"],
+                read_timeout=ollama["read_timeout"],
+                pool_size=ollama["pool_size"],
+            )
+            backends.append(Backend(
+                spec.get("name") or client.host,
+                client,
+                spec.get("models", []),
+                spec.get("max_concurrency", settings["max_concurrency"]),
+            ))
+        return cls(
+            backends,
+            model=ollama["model"],
+            options=ollama["options"],
+            routes=settings["routes"],
+            short_prompt_tokens=settings["short_prompt_tokens"],
+            queue_timeout=settings["queue_timeout"],
+            health_interval=settings["health_interval"],
+        )
+
+    def route(self, messages, task=None):
+        """Model for a request: the route of task (e.g. "ocr"), the "short" route for a short last message, or the default."""
+        if task and task in self.routes:
+            return self.routes[task]
+        if "short" in self.routes and messages and estimate_tokens(messages[-1]["content"]) <= self.short_prompt_tokens:
+            return self.routes["short"]
+        return self.model
+
+    def status(self):
+        """One row per backend, for diagnostics."""
+        with self._cond:
+            return [
+                {
+                    "backend": backend.name,
+                    "healthy": backend.healthy,
+                    "active": backend.active,
+                    "max_concurrency": backend.max_concurrency,
+                    "models": ", ".join(backend.models) or "any",
+                }
+                for backend in self.backends
+            ]
+
+    def queued(self):
+        with self._cond:
+            return sum(len(queue) for queue in self._waiting.values())
+
+    # --------------------
+    # OllamaClient interface
+    # --------------------
+    def chat_stream(self, messages, model=None, options=None, stats=None, owner=None):
+        model = model or self.route(messages)
+        return self._stream_text(
+            model, owner, stats,
+            lambda client: client.chat_chunks(messages, model, options),
+            lambda chunk: chunk.get("message", {}).get("content"),
+        )
+
+    def chat(self, messages, model=None, options=None, owner=None, task=None):
+        """Non-streaming /api/chat call. Returns the reply text; raises on failure."""
+        model = model or self.route(messages, task)
+        return self._call(model, owner, lambda client: client.chat(messages, model, options))
+
+    def embed(self, texts, model=None, owner=None):
+        """Embedding vectors from /api/embed, one per input text. Raises on failure."""
+        model = model or self.model
+        return self._call(model, owner, lambda client: client.embed(texts, model))
+
+    def preload(self):
+        """Loads every routed model on the backends that serve it."""
+        for model in {self.model, *self.routes.values()}:
+            for backend in self._serving(model):
+                backend.client.preload(model)
+
+    # --------------------
+    # Dispatch
+    # --------------------
+    def _stream_text(self, model, owner, stats, open_chunks, text_of):
+        tried, error = set(), None
+        while True:
+            try:
+                backend = self._acquire(model, owner, tried)
+            except NoBackendError as e:
+                yield f"⚠️ Ollama error: {error or e}"  # after a failover, the error that caused it says more
+                return
+            started = False
+            try:
+                for chunk in open_chunks(backend.client):
+                    if not started:
+                        started = True
+                        self._set_health(backend, True)
+                    if chunk.get("done") and stats is not None:
+                        stats.update(generation_stats(chunk), model=model, backend=backend.name)
+                    yield text_of(chunk) or ""
+                return
+            except Exception as e:
+                if started or not self._failed(backend, e):
+                    yield f"⚠️ Ollama error: {e}"
+                    return
+                tried.add(backend.name)
+                error = e
+            finally:
+                self._release(backend)
+
+    def _call(self, model, owner, call):
+        tried, error = set(), None
+        while True:
+            try:
+                backend = self._acquire(model, owner, tried)
+            except NoBackendError:
+                if error is not None:
+                    raise error from None
+                raise
+            try:
+                result = call(backend.client)
+                self._set_health(backend, True)
+                return result
+            except requests.RequestException as e:
+                if not self._failed(backend, e):
+                    raise
+                tried.add(backend.name)
+                error = e
+            finally:
+                self._release(backend)
+
+    def _failed(self, backend, error):
+        """Whether a request that failed before any output should move to another backend."""
+        if isinstance(error, requests.ConnectionError):
+            if self.health_interval and self.health_interval > 0:
+                self._set_health(backend, False)  # until the health check sees it answer again
+        elif not (isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code >= 500):
+            return False
+        METRICS.count("ollama_failovers")
+        return True
+
+    def _serving(self, model):
+        # a model no backend lists may run on any of them
+        listed = [backend for backend in self.backends if model in backend.models]
+        return listed or [backend for backend in self.backends if not backend.models] or self.backends
+
+    def _candidates(self, model, exclude):
+        # with no healthy backend left, try the unhealthy ones rather than fail every request until the next health check
+        untried = [b for b in self._serving(model) if b.name not in exclude]
+        return [b for b in untried if b.healthy] or untried
+
+    def _acquire(self, model, owner, exclude):
+        """Waits for a free slot on a backend serving model, healthy ones first, in the owner's turn."""
+        waiter = {"model": model, "exclude": exclude, "backend": None}
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            self._waiting.setdefault(owner, deque()).append(waiter)
+            try:
+                self._dispatch()
+                while waiter["backend"] is None:
+                    if not self._candidates(model, exclude):
+                        raise NoBackendError(f"no Ollama backend left to try for {model}")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise NoBackendError(f"every Ollama backend for {model} stayed busy for {self.queue_timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                if waiter["backend"] is None:
+                    queue = self._waiting.get(owner)
+                    if queue is not None and waiter in queue:
+                        queue.remove(waiter)
+                        if not queue:
+                            del self._waiting[owner]
+        METRICS.observe("ollama_queue_wait", time.perf_counter() - start)
+        return waiter["backend"]
+
+    def _dispatch(self):
+        # hands free slots to the oldest request of each owner in turn; called with the lock held
+        served = True
+        while served:
+            served = False
+            for owner, queue in list(self._waiting.items()):
+                waiter = queue[0]
+                free = [b for b in self._candidates(waiter["model"], waiter["exclude"]) if b.active < b.max_concurrency]
+                if not free:
+                    continue
+                backend = min(free, key=lambda b: b.active / b.max_concurrency)
+                backend.active += 1
+                waiter["backend"] = backend
+                queue.popleft()
+                if queue:
+                    self._waiting.move_to_end(owner)
+                else:
+                    del self._waiting[owner]
+                served = True
+                break
+        self._cond.notify_all()
+
+    def _release(self, backend):
+        with self._cond:
+            backend.active -= 1
+            self._dispatch()
+
+    def _set_health(self, backend, healthy):
+        with self._cond:
+            if backend.healthy != healthy:
+                backend.healthy = healthy
+                self._dispatch()
+
+    def _watch(self):
+        while True:
+            for backend in self.backends:
+                self._set_health(backend, backend.client.ping())
+            time.sleep(self.health_interval)
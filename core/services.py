@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from .archive import DEFAULT_ARCHIVE_CONFIG, SessionArchive, archive_dir, idle_cutoff
+from .blobstore import BLOB_DIR, BlobStore
+from .jobs import JobManager
+from .metrics import DEFAULT_METRICS_CONFIG, METRICS, serve_metrics
+from .ocr import DEFAULT_OCR_CONFIG, OCR_CACHE_FILE, OcrCache
+from .response_cache import DEFAULT_RESPONSE_CACHE_CONFIG, RESPONSE_CACHE_FILE, ResponseCache
+from .router import OllamaRouter
+from .storage import DEFAULT_STORAGE_CONFIG, DEFAULT_USER, SessionStore, migrate_json, resolve_user, user_db_path
+
+CONFIG_FILE = "config.json"
+HISTORY_FILE = "chat_sessions.json"  # legacy format, imported once for the default user
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------
+# Config
+# --------------------
+def load_config(path=CONFIG_FILE):
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return {"theme": "light"}
+    return {"theme": "light"}
+
+
+def section(config, name, defaults):
+    """
+    The `name` section of config.json merged over its defaults; dict-valued
+    settings (e.g. ocr.preprocess) are merged one level deep, so a partial
+    override keeps the other defaults.
+    """
+    overrides = config.get(name, {})
+    settings = dict(defaults, **overrides)
+    for key, default in defaults.items():
+        if isinstance(default, dict):
+            settings[key] = dict(default, **overrides.get(key, {}))
+    return settings
+
+
+# --------------------
+# Shared services
+# --------------------
+class Services:
+    """
+    Long-lived objects of one process, shared by the Streamlit apps and the
+    HTTP API: the Ollama router and reply workers, the response, OCR and blob
+    stores, and one SessionStore per user.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.storage = section(config, "storage", DEFAULT_STORAGE_CONFIG)
+        self.archive = section(config, "archive", DEFAULT_ARCHIVE_CONFIG)
+        self.client = OllamaRouter.from_config(config)
+        self.client.preload()
+        self.response_cache = self._response_cache(section(config, "response_cache", DEFAULT_RESPONSE_CACHE_CONFIG))
+        self.jobs = JobManager(self.client, self.response_cache)
+        self.blobs = BlobStore(BLOB_DIR)
+        self.ocr_cache = OcrCache(
+            OCR_CACHE_FILE, section(config, "ocr", DEFAULT_OCR_CONFIG)["cache_max_bytes"], self.storage["journal_mode"]
+        )
+        self._stores = {}
+        self._lock = threading.Lock()
+
+        metrics = section(config, "metrics", DEFAULT_METRICS_CONFIG)
+        METRICS.configure(metrics["log_file"])
+        self.metrics_server = serve_metrics(metrics["port"], metrics["host"]) if metrics["port"] else None
+        if self.archive["idle_days"] > 0:
+            threading.Thread(target=self._archive_periodically, daemon=True).start()
+
+    def _response_cache(self, settings):
+        if not settings["enabled"]:
+            return None
+        client = self.client
+        return ResponseCache(
+            RESPONSE_CACHE_FILE, settings, embed=lambda text: client.embed([text], settings["embed_model"])[0],
+            journal_mode=self.storage["journal_mode"],
+        )
+
+    def user_for(self, headers, query_params):
+        return resolve_user(headers, query_params, self.storage)
+
+    def store(self, user):
+        """
+        The user's SessionStore, opened (and for the default user, migrated
+        from JSON) on first use. Replies a dead process left unfinished are
+        marked interrupted, and sessions idle past archive.idle_days are
+        archived in the background, then every archive.check_hours.
+        """
+        with self._lock:
+            store = self._stores.get(user)
+            if store is None:
+                path = user_db_path(user, self.storage["users_dir"])
+                archive = SessionArchive(archive_dir(path), self.archive["compression"], self.archive["segment_max_bytes"])
+                store = SessionStore(path, self.storage["journal_mode"], archive)
+                if user == DEFAULT_USER and store.is_empty() and os.path.exists(HISTORY_FILE):
+                    migrate_json(HISTORY_FILE, store, self.blobs)
+                self.jobs.recover(store)
+                if self.archive["idle_days"] > 0:
+                    threading.Thread(target=self._archive, args=(store,), daemon=True).start()
+                self._stores[user] = store
+            return store
+
+    def _archive(self, store):
+        try:
+            store.archive_idle(idle_cutoff(self.archive["idle_days"]))
+        except Exception:
+            logger.exception("Archiving %s failed", store.path)
+
+    def _archive_periodically(self):
+        # long-running servers keep archiving the stores they opened, not just once per store
+        while True:
+            time.sleep(self.archive["check_hours"] * 3600)
+            with self._lock:
+                stores = list(self._stores.values())
+            for store in stores:
+                self._archive(store)
@@ -0,0 +1,758 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from .archive import SessionArchive, archive_dir
+from .db import connect
+from .metrics import span
+
+DB_FILE = os.path.join("data", "chat_sessions.db")  # single-user location, kept for the default user
+USERS_DIR = os.path.join("data", "users")
+DEFAULT_USER = "default"
+
+DEFAULT_STORAGE_CONFIG = {
+    "users_dir": USERS_DIR,
+    "user_header": "X-Forwarded-User",  # set by the authenticating reverse proxy
+    "allow_user_param": False,  # accept ?user=name; only for local testing
+    "journal_mode": "wal",  # use "delete" when the data directory is on a network filesystem
+}
+
+# Searchable text of a message row: its content plus any OCR output.
+_SEARCH_BODY = (
+    "trim(COALESCE(json_extract({data}, '$.content'), '') || ' ' || "
+    "COALESCE(json_extract({data}, '$.ocr_text'), ''))"
+)
+
+# Each entry upgrades the schema by one version (tracked in PRAGMA user_version).
+_MIGRATIONS = [
+    """
+    CREATE TABLE sessions (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        created TEXT NOT NULL,
+        updated TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX messages_by_session ON messages(session_id, id);
+    """,
+    """
+    ALTER TABLE sessions ADD COLUMN summary TEXT NOT NULL DEFAULT '';
+    ALTER TABLE sessions ADD COLUMN summary_until INTEGER NOT NULL DEFAULT 0;
+    """,
+    """
+    CREATE VIRTUAL TABLE message_search USING fts5(
+        body, session_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+    );
+    CREATE VIRTUAL TABLE title_search USING fts5(
+        title, session_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+    );
+    INSERT INTO message_search (rowid, body, session_id)
+        SELECT id, {message_body}, session_id FROM messages;
+    INSERT INTO title_search (rowid, title, session_id)
+        SELECT rowid, title, id FROM sessions;
+
+    CREATE TRIGGER messages_search_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO message_search (rowid, body, session_id) VALUES (new.id, {new_message_body}, new.session_id);
+    END;
+    CREATE TRIGGER messages_search_update AFTER UPDATE OF data ON messages BEGIN
+        UPDATE message_search SET body = {new_message_body} WHERE rowid = new.id;
+    END;
+    CREATE TRIGGER messages_search_delete AFTER DELETE ON messages BEGIN
+        DELETE FROM message_search WHERE rowid = old.id;
+    END;
+    CREATE TRIGGER sessions_search_insert AFTER INSERT ON sessions BEGIN
+        INSERT INTO title_search (rowid, title, session_id) VALUES (new.rowid, new.title, new.id);
+    END;
+    CREATE TRIGGER sessions_search_update AFTER UPDATE OF title ON sessions BEGIN
+        UPDATE title_search SET title = new.title WHERE rowid = new.rowid;
+    END;
+    CREATE TRIGGER sessions_search_delete AFTER DELETE ON sessions BEGIN
+        DELETE FROM title_search WHERE rowid = old.rowid;
+    END;
+    """.format(
+        message_body=_SEARCH_BODY.format(data="data"),
+        new_message_body=_SEARCH_BODY.format(data="new.data"),
+    ),
+    """
+    ALTER TABLE sessions ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+    CREATE TABLE meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    INSERT INTO meta (key, value) VALUES ('revision', 0);
+    CREATE TABLE preferences (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    """,
+    """
+    CREATE INDEX sessions_by_updated ON sessions(updated);
+    """,
+    """
+    CREATE TABLE archived_sessions (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        created TEXT NOT NULL,
+        updated TEXT NOT NULL,
+        message_count INTEGER NOT NULL,
+        segment TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        length INTEGER NOT NULL
+    );
+    CREATE INDEX archived_by_updated ON archived_sessions(updated);
+    CREATE INDEX archived_by_segment ON archived_sessions(segment);
+    """,
+    """
+    ALTER TABLE sessions ADD COLUMN accessed TEXT NOT NULL DEFAULT '';
+    """,
+    """
+    CREATE TABLE archived_messages (
+        id INTEGER PRIMARY KEY,
+        session_id TEXT NOT NULL REFERENCES archived_sessions(id) ON DELETE CASCADE,
+        body TEXT NOT NULL
+    );
+    CREATE INDEX archived_messages_by_session ON archived_messages(session_id);
+    CREATE VIRTUAL TABLE archived_message_search USING fts5(
+        body, content = 'archived_messages', content_rowid = 'id', tokenize = 'unicode61 remove_diacritics 2'
+    );
+    CREATE VIRTUAL TABLE archived_title_search USING fts5(
+        title, content = 'archived_sessions', tokenize = 'unicode61 remove_diacritics 2'
+    );
+    INSERT INTO archived_title_search (archived_title_search) VALUES ('rebuild');
+
+    CREATE TRIGGER archived_messages_search_insert AFTER INSERT ON archived_messages BEGIN
+        INSERT INTO archived_message_search (rowid, body) VALUES (new.id, new.body);
+    END;
+    CREATE TRIGGER archived_messages_search_delete AFTER DELETE ON archived_messages BEGIN
+        INSERT INTO archived_message_search (archived_message_search, rowid, body) VALUES ('delete', old.id, old.body);
+    END;
+    CREATE TRIGGER archived_sessions_search_insert AFTER INSERT ON archived_sessions BEGIN
+        INSERT INTO archived_title_search (rowid, title) VALUES (new.rowid, new.title);
+    END;
+    CREATE TRIGGER archived_sessions_search_delete AFTER DELETE ON archived_sessions BEGIN
+        INSERT INTO archived_title_search (archived_title_search, rowid, title) VALUES ('delete', old.rowid, old.title);
+    END;
+    """,
+]
+
+
+# --------------------
+# Users
+# --------------------
+def resolve_user(headers=None, query_params=None, settings=DEFAULT_STORAGE_CONFIG):
+    """
+    Name of the user a request belongs to: the reverse proxy's user header,
+    then ?user= when allowed, else DEFAULT_USER.
+    """
+    user = (headers or {}).get(settings["user_header"]) if settings.get("user_header") else None
+    if not user and settings.get("allow_user_param"):
+        user = (query_params or {}).get("user")
+    user = (user or "").strip()
+    return user or DEFAULT_USER
+
+
+def user_db_path(user, users_dir=USERS_DIR):
+    """
+    Database file of one user. Names are reduced to safe characters, with a
+    hash suffix when that changed them so distinct users never share a file.
+    The default user keeps using DB_FILE if a single-user install left one.
+    """
+    if user == DEFAULT_USER and os.path.exists(DB_FILE) and users_dir == USERS_DIR:
+        if not os.path.exists(os.path.join(users_dir, DEFAULT_USER)):
+            return DB_FILE
+    name = re.sub(r"[^A-Za-z0-9_.@-]", "_", user)[:64].lstrip(".")
+    if name != user:
+        name = f"{name}-{hashlib.sha256(user.encode('utf-8')).hexdigest()[:12]}"
+    return os.path.join(users_dir, name, "chat_sessions.db")
+
+
+# --------------------
+# Session store
+# --------------------
+class SessionStore:
+    """
+    SQLite-backed chat history.
+    Every mutation touches only the rows that changed and runs in its own
+    transaction, so a crash mid-write leaves the previous state intact.
+
+    Several tabs, worker threads and Streamlit replicas may share one file:
+    writers serialize on SQLite's lock (waiting up to 30s), and every write
+    bumps a store-wide and a per-session revision so readers can reload just
+    what changed (see refresh()).
+
+    Idle sessions can be moved out to a SessionArchive (archive_idle()).
+    They stay in the session index and in search, and are restored on first
+    load_session() or on the first write to them.
+    """
+
+    def __init__(self, path=DB_FILE, journal_mode=DEFAULT_STORAGE_CONFIG["journal_mode"], archive=None):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.archive = archive or SessionArchive(archive_dir(path))
+        with self._connect() as conn:
+            conn.execute(f"PRAGMA journal_mode={journal_mode}")
+            self._migrate(conn)
+
+    def _connect(self):
+        return connect(self.path, "synchronous=NORMAL", "foreign_keys=ON")
+
+    @contextmanager
+    def _transaction(self, mode="IMMEDIATE"):
+        """Write transaction by default; mode="DEFERRED" gives a consistent read snapshot."""
+        with span("db_write" if mode == "IMMEDIATE" else "db_read"), self._connect() as conn:
+            conn.execute(f"BEGIN {mode}")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _migrate(self, conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        while version < len(_MIGRATIONS):
+            try:
+                conn.executescript(
+                    f"BEGIN IMMEDIATE;\n{_MIGRATIONS[version]}\nPRAGMA user_version = {version + 1};\nCOMMIT;"
+                )
+            except sqlite3.OperationalError:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if conn.execute("PRAGMA user_version").fetchone()[0] == version:
+                    raise
+                # another process applied this migration first
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def _bump(self, conn, chat_id):
+        """Marks chat_id, and the store as a whole, as changed."""
+        conn.execute("UPDATE sessions SET revision = revision + 1 WHERE id = ?", (chat_id,))
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+
+    # --------------------
+    # Reads
+    # --------------------
+    def is_empty(self):
+        """True when the store holds no sessions, live or archived."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT 1 FROM sessions UNION ALL SELECT 1 FROM archived_sessions LIMIT 1"
+            ).fetchone() is None
+
+    def revision(self):
+        """Store-wide revision; changes whenever any session is written."""
+        with self._connect() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def list_sessions(self, limit=20, offset=0):
+        """
+        One page of the session index, archived sessions included, most
+        recently active first: dicts with id, title, updated, message_count
+        and archived. No message is read.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, title, updated, message_count, 0 AS archived, rowid AS seq FROM sessions "
+                "UNION ALL SELECT id, title, updated, message_count, 1, rowid FROM archived_sessions "
+                "ORDER BY updated DESC, archived, seq DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [
+            {"id": chat_id, "title": title, "updated": updated, "message_count": message_count, "archived": bool(archived)}
+            for chat_id, title, updated, message_count, archived, _ in rows
+        ]
+
+    def count_sessions(self):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT (SELECT COUNT(*) FROM sessions) + (SELECT COUNT(*) FROM archived_sessions)"
+            ).fetchone()[0]
+
+    def load_sessions(self):
+        """
+        Returns {chat_id: {"title", "messages", "summary", "summary_until", "revision"}}
+        in creation order.
+        """
+        with self._transaction("DEFERRED") as conn:
+            sessions = {
+                chat_id: {
+                    "title": title, "messages": [], "summary": summary,
+                    "summary_until": summary_until, "revision": revision,
+                }
+                for chat_id, title, summary, summary_until, revision in conn.execute(
+                    "SELECT id, title, summary, summary_until, revision FROM sessions ORDER BY created, rowid"
+                )
+            }
+            for message_id, chat_id, data in conn.execute("SELECT id, session_id, data FROM messages ORDER BY id"):
+                message = json.loads(data)
+                message["id"] = message_id
+                sessions[chat_id]["messages"].append(message)
+        return sessions
+
+    def load_session(self, chat_id):
+        """
+        Returns one session in the load_sessions() shape, or None if it does
+        not exist. An archived session is restored first.
+        """
+        session = self._load_live(chat_id)
+        if session is None and self.rehydrate(chat_id):
+            session = self._load_live(chat_id)
+        return session
+
+    def _load_live(self, chat_id):
+        with self._transaction("DEFERRED") as conn:
+            row = conn.execute(
+                "SELECT title, summary, summary_until, revision FROM sessions WHERE id = ?", (chat_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            session = {
+                "title": row[0], "messages": [], "summary": row[1], "summary_until": row[2], "revision": row[3],
+            }
+            for message_id, data in conn.execute(
+                "SELECT id, data FROM messages WHERE session_id = ? ORDER BY id", (chat_id,)
+            ):
+                message = json.loads(data)
+                message["id"] = message_id
+                session["messages"].append(message)
+        return session
+
+    def get_message(self, message_id, chat_id=None):
+        """One stored message (with its "id"), optionally only if it belongs to chat_id."""
+        query, params = "SELECT data FROM messages WHERE id = ?", [message_id]
+        if chat_id is not None:
+            query += " AND session_id = ?"
+            params.append(chat_id)
+        with self._connect() as conn:
+            row = conn.execute(query, params).fetchone()
+        if row is None:
+            return None
+        message = json.loads(row[0])
+        message["id"] = message_id
+        return message
+
+    def refresh(self, sessions, known_revision=None):
+        """
+        Brings the sessions loaded in a load_session() dict up to date with
+        writes made by other tabs, threads or replicas: reloads those whose
+        revision moved and drops deleted ones. Sessions archived meanwhile
+        are kept as loaded, and sessions not loaded yet are left alone.
+        Costs one query when nothing changed.
+        Returns the store revision to pass as known_revision next time.
+        """
+        with self._transaction("DEFERRED") as conn:
+            revision = conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+            if revision == known_revision or not sessions:
+                return revision
+            placeholders = ", ".join("?" * len(sessions))
+            current = dict(conn.execute(
+                f"SELECT id, revision FROM sessions WHERE id IN ({placeholders})", list(sessions)
+            ))
+            archived = {row[0] for row in conn.execute(
+                f"SELECT id FROM archived_sessions WHERE id IN ({placeholders})", list(sessions)
+            )}
+        for chat_id in list(sessions):
+            session = sessions[chat_id]
+            if chat_id in archived or (chat_id in current and session.get("revision") == current[chat_id]):
+                continue
+            session = self.load_session(chat_id) if chat_id in current else None
+            if session is None:
+                del sessions[chat_id]
+            else:
+                sessions[chat_id] = session
+        return revision
+
+    def get_preference(self, key, default=None):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM preferences WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def search(self, query, limit=20):
+        """
+        Full-text search over titles, messages and OCR text.
+        Returns ranked hits as dicts with chat_id, title, message_id (None for
+        title matches) and a snippet with matches wrapped in **. Archived
+        sessions are searched through their own index without being restored;
+        load_session() restores one when its hit is opened.
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+        with self._connect() as conn:
+            title_hits = conn.execute(
+                "SELECT session_id, title, NULL, highlight(title_search, 0, '**', '**'), rank "
+                "FROM title_search WHERE title_search MATCH ? "
+                "UNION ALL SELECT a.id, a.title, NULL, highlight(archived_title_search, 0, '**', '**'), ats.rank "
+                "FROM archived_title_search ats JOIN archived_sessions a ON a.rowid = ats.rowid "
+                "WHERE archived_title_search MATCH ? ORDER BY 5 LIMIT ?",
+                (match, match, limit),
+            ).fetchall()
+            message_hits = conn.execute(
+                "SELECT ms.session_id, s.title, ms.rowid, snippet(message_search, 0, '**', '**', '…', 12), ms.rank "
+                "FROM message_search ms JOIN sessions s ON s.id = ms.session_id WHERE message_search MATCH ? "
+                "UNION ALL SELECT am.session_id, a.title, am.id, "
+                "snippet(archived_message_search, 0, '**', '**', '…', 12), ams.rank "
+                "FROM archived_message_search ams JOIN archived_messages am ON am.id = ams.rowid "
+                "JOIN archived_sessions a ON a.id = am.session_id "
+                "WHERE archived_message_search MATCH ? ORDER BY 5 LIMIT ?",
+                (match, match, limit),
+            ).fetchall()
+        return [
+            {"chat_id": chat_id, "title": title, "message_id": message_id, "snippet": snippet}
+            for chat_id, title, message_id, snippet, _ in (title_hits + message_hits)[:limit]
+        ]
+
+    # --------------------
+    # Writes
+    # --------------------
+    def set_preference(self, key, value):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO preferences (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, json.dumps(value)),
+            )
+
+    def create_session(self, chat_id, title, messages=()):
+        with self._transaction() as conn:
+            self._insert_session(conn, chat_id, title, messages)
+            self._bump(conn, chat_id)
+
+    def rename_session(self, chat_id, title):
+        """Returns False when the chat does not exist. Like every write to one chat, restores it if archived."""
+        with self._transaction() as conn:
+            renamed = conn.execute(
+                "UPDATE sessions SET title = ?, updated = ? WHERE id = ?",
+                (title, datetime.now().isoformat(), chat_id),
+            ).rowcount > 0
+            self._bump(conn, chat_id)
+        if not renamed and self.rehydrate(chat_id):
+            return self.rename_session(chat_id, title)
+        return renamed
+
+    def set_summary(self, chat_id, summary, summary_until):
+        """Records the rolling summary covering every message up to id summary_until."""
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE sessions SET summary = ?, summary_until = ? WHERE id = ?",
+                (summary, summary_until, chat_id),
+            ).rowcount > 0
+            self._bump(conn, chat_id)
+        if not updated and self.rehydrate(chat_id):
+            self.set_summary(chat_id, summary, summary_until)
+
+    def append_message(self, chat_id, message):
+        """Appends one message, stores its row id on it and returns the id."""
+        try:
+            with self._transaction() as conn:
+                message["id"] = self._insert_message(conn, chat_id, message)
+                conn.execute(
+                    "UPDATE sessions SET updated = ?, message_count = message_count + 1 WHERE id = ?",
+                    (message.get("time") or datetime.now().isoformat(), chat_id),
+                )
+                self._bump(conn, chat_id)
+        except sqlite3.IntegrityError:
+            if not self.rehydrate(chat_id):
+                raise  # no such chat
+            return self.append_message(chat_id, message)
+        return message["id"]
+
+    def update_message(self, message_id, message):
+        """Rewrites one stored message in place (used while a reply is streaming)."""
+        data = {k: v for k, v in message.items() if k != "id"}
+        with self._transaction() as conn:
+            row = conn.execute("SELECT session_id FROM messages WHERE id = ?", (message_id,)).fetchone()
+            if row is None:
+                return  # the chat was cleared or deleted meanwhile
+            conn.execute("UPDATE messages SET data = ? WHERE id = ?", (json.dumps(data), message_id))
+            self._bump(conn, row[0])
+
+    def recover_interrupted(self, before, live_ids=()):
+        """
+        Removes the "status" of reply placeholders last written before
+        `before` (an ISO timestamp) whose id is not in live_ids, marking them
+        "interrupted"; an empty one gets an error text and flag. Returns the count.
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, session_id, data FROM messages WHERE json_extract(data, '$.status') IS NOT NULL"
+            ).fetchall()
+            recovered = 0
+            for message_id, chat_id, data in rows:
+                message = json.loads(data)
+                if message_id in live_ids or (message.get("updated") or message.get("time") or "") >= before:
+                    continue
+                message.pop("status", None)
+                message["interrupted"] = True
+                if not message.get("content"):
+                    message["content"] = "⚠️ Reply was interrupted before it finished."
+                    message["error"] = True
+                conn.execute("UPDATE messages SET data = ? WHERE id = ?", (json.dumps(message), message_id))
+                self._bump(conn, chat_id)
+                recovered += 1
+        return recovered
+
+    def clear_messages(self, chat_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (chat_id,))
+            cleared = conn.execute(
+                "UPDATE sessions SET updated = ?, message_count = 0, summary = '', summary_until = 0 WHERE id = ?",
+                (datetime.now().isoformat(), chat_id),
+            ).rowcount > 0
+            self._bump(conn, chat_id)
+        if not cleared and self.rehydrate(chat_id):
+            self.clear_messages(chat_id)
+
+    def delete_session(self, chat_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (chat_id,))
+            archived = conn.execute("DELETE FROM archived_sessions WHERE id = ?", (chat_id,)).rowcount > 0
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+        if archived:
+            self._drop_unused_segments()
+
+    # --------------------
+    # Archive
+    # --------------------
+    def archive_idle(self, before):
+        """
+        Moves sessions last active, and last restored, before `before` (an
+        ISO timestamp) into the archive, one at a time: the record is written
+        and synced first, then the session is swapped for its index and
+        search entries in one transaction, so a crash never loses a chat.
+        Returns the number archived.
+        """
+        with self._connect() as conn:
+            chat_ids = [row[0] for row in conn.execute(
+                "SELECT id FROM sessions WHERE updated < ? AND accessed < ? ORDER BY updated", (before, before)
+            )]
+        archived = 0
+        for chat_id in chat_ids:
+            record, revision = self._record(chat_id)
+            if record is None or any(m.get("status") for m in record["messages"]):
+                continue  # deleted meanwhile, or a reply is still generating
+            segment, position, length = self.archive.append(record)
+            with self._transaction() as conn:
+                current = conn.execute(
+                    "SELECT revision FROM sessions WHERE id = ? AND updated < ? AND accessed < ?", (chat_id, before, before)
+                ).fetchone()
+                if current is None or current[0] != revision:
+                    continue  # written or restored meanwhile; the frame just written stays unreferenced
+                conn.execute(
+                    "INSERT INTO archived_sessions (id, title, created, updated, message_count, segment, position, length) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (chat_id, record["title"], record["created"], record["updated"], len(record["messages"]),
+                     segment, position, length),
+                )
+                conn.execute(
+                    "INSERT INTO archived_messages (id, session_id, body) "
+                    f"SELECT id, session_id, body FROM (SELECT id, session_id, {_SEARCH_BODY.format(data='data')} AS body "
+                    "FROM messages WHERE session_id = ?) WHERE body != ''",
+                    (chat_id,),
+                )
+                conn.execute("DELETE FROM sessions WHERE id = ?", (chat_id,))
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+            archived += 1
+        return archived
+
+    def rehydrate(self, chat_id):
+        """
+        Restores an archived session, message ids included, and records when,
+        so the next archive_idle() pass leaves it alone. Returns False if it
+        was not archived.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT segment, position, length FROM archived_sessions WHERE id = ?", (chat_id,)
+            ).fetchone()
+        if row is None:
+            return False
+        record = self.archive.read(*row)
+        with self._transaction() as conn:
+            if conn.execute("DELETE FROM archived_sessions WHERE id = ?", (chat_id,)).rowcount:
+                self._insert_record(conn, record, keep_ids=True)
+                conn.execute("UPDATE sessions SET accessed = ? WHERE id = ?", (datetime.now().isoformat(), chat_id))
+                self._bump(conn, chat_id)
+        self._drop_unused_segments()
+        return True
+
+    def iter_records(self):
+        """
+        Yields every session, live then archived, as an archive record
+        ({"id", "title", "created", "updated", "summary", "summary_until",
+        "messages"}), reading one session at a time.
+        """
+        with self._connect() as conn:
+            chat_ids = [row[0] for row in conn.execute("SELECT id FROM sessions ORDER BY created, rowid")]
+        for chat_id in chat_ids:
+            record, _ = self._record(chat_id)
+            if record is not None:
+                yield record
+        with self._connect() as conn:
+            locations = conn.execute(
+                "SELECT segment, position, length FROM archived_sessions ORDER BY segment, position"
+            ).fetchall()
+        for location in locations:
+            yield self.archive.read(*location)
+
+    def _record(self, chat_id):
+        """(archive record, revision) of a live session, or (None, None)."""
+        with self._transaction("DEFERRED") as conn:
+            row = conn.execute(
+                "SELECT title, created, updated, summary, summary_until, revision FROM sessions WHERE id = ?", (chat_id,)
+            ).fetchone()
+            if row is None:
+                return None, None
+            title, created, updated, summary, summary_until, revision = row
+            messages = []
+            for message_id, data in conn.execute(
+                "SELECT id, data FROM messages WHERE session_id = ? ORDER BY id", (chat_id,)
+            ):
+                message = json.loads(data)
+                message["id"] = message_id
+                messages.append(message)
+        record = {
+            "id": chat_id, "title": title, "created": created, "updated": updated,
+            "summary": summary, "summary_until": summary_until, "messages": messages,
+        }
+        return record, revision
+
+    def _drop_unused_segments(self):
+        with self._connect() as conn:
+            used = {row[0] for row in conn.execute("SELECT DISTINCT segment FROM archived_sessions")}
+        for segment in self.archive.segments():
+            if segment not in used:
+                self.archive.delete(segment)
+
+    def import_records(self, records, batch_size=100):
+        """
+        Inserts sessions from archive/export records (any iterable, consumed
+        lazily), batch_size per transaction, skipping ids already stored.
+        Messages get new ids. Returns the number imported.
+        """
+        imported = 0
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                imported += self._import_batch(batch)
+                batch = []
+        if batch:
+            imported += self._import_batch(batch)
+        return imported
+
+    def _import_batch(self, records):
+        imported = 0
+        with self._transaction() as conn:
+            for record in records:
+                if conn.execute(
+                    "SELECT 1 FROM sessions WHERE id = ? UNION ALL SELECT 1 FROM archived_sessions WHERE id = ?",
+                    (record["id"], record["id"]),
+                ).fetchone():
+                    continue
+                self._insert_record(conn, record, keep_ids=False)
+                self._bump(conn, record["id"])
+                imported += 1
+        return imported
+
+    def import_sessions(self, sessions):
+        """Bulk-inserts sessions in the legacy JSON shape, skipping ids already stored or archived."""
+        imported = 0
+        with self._transaction() as conn:
+            for chat_id, session in sessions.items():
+                if conn.execute(
+                    "SELECT 1 FROM sessions WHERE id = ? UNION ALL SELECT 1 FROM archived_sessions WHERE id = ?",
+                    (chat_id, chat_id),
+                ).fetchone():
+                    continue
+                self._insert_session(conn, chat_id, session.get("title", "New Chat"), session.get("messages", []))
+                self._bump(conn, chat_id)
+                imported += 1
+        return imported
+
+    def _insert_record(self, conn, record, keep_ids):
+        """Inserts an archive/export record; without keep_ids, messages get new ids and summary_until follows them."""
+        messages = record.get("messages", [])
+        now = datetime.now().isoformat()
+        conn.execute(
+            "INSERT INTO sessions (id, title, created, updated, message_count, summary, summary_until) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (record["id"], record.get("title", "New Chat"), record.get("created", now), record.get("updated", now),
+             len(messages), record.get("summary", ""), 0),
+        )
+        summary_until = 0
+        for message in messages:
+            old_id = message.get("id")
+            data = {k: v for k, v in message.items() if k != "id"}
+            if keep_ids and old_id is not None:
+                conn.execute(
+                    "INSERT INTO messages (id, session_id, data) VALUES (?, ?, ?)",
+                    (old_id, record["id"], json.dumps(data)),
+                )
+                new_id = old_id
+            else:
+                new_id = self._insert_message(conn, record["id"], data)
+            if old_id is not None and old_id <= record.get("summary_until", 0):
+                summary_until = new_id
+        conn.execute("UPDATE sessions SET summary_until = ? WHERE id = ?", (summary_until, record["id"]))
+
+    def _insert_session(self, conn, chat_id, title, messages):
+        times = [m["time"] for m in messages if m.get("time")]
+        now = datetime.now().isoformat()
+        conn.execute(
+            "INSERT INTO sessions (id, title, created, updated, message_count) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, title, min(times, default=now), max(times, default=now), len(messages)),
+        )
+        for message in messages:
+            message["id"] = self._insert_message(conn, chat_id, message)
+
+    def _insert_message(self, conn, chat_id, message):
+        data = {k: v for k, v in message.items() if k != "id"}
+        cursor = conn.execute(
+            "INSERT INTO messages (session_id, data) VALUES (?, ?)",
+            (chat_id, json.dumps(data)),
+        )
+        return cursor.lastrowid
+
+
+def _fts_query(query):
+    """Turns free text into an FTS5 query: every word must match, the last one as a prefix."""
+    terms = [term.replace('"', "") for term in query.split()]
+    terms = [f'"{term}"' for term in terms if term]
+    if not terms:
+        return ""
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+# --------------------
+# Migration from chat_sessions.json
+# --------------------
+def migrate_json(json_path, store, blobs=None):
+    """
+    One-shot import of a legacy chat_sessions.json file. Safe to run repeatedly.
+    When a BlobStore is given, inline base64 images are moved into it.
+    """
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            sessions = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return 0
+    if blobs is not None:
+        from .blobstore import externalize_inline_images
+        externalize_inline_images(sessions, blobs)
+    return store.import_sessions(sessions)
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "chat_sessions.json"
+    from .blobstore import BLOB_DIR, BlobStore
+    target = sys.argv[2] if len(sys.argv) > 2 else user_db_path(DEFAULT_USER)  # where the apps look for it
+    blob_dir = sys.argv[3] if len(sys.argv) > 3 else BLOB_DIR
+    count = migrate_json(source, SessionStore(target), BlobStore(blob_dir))
+    print(f"Imported {count} session(s) from {source} into {target}")
@@ -0,0 +1,94 @@
+import html
+import time
+
+
+# --------------------
+# Throttled reply accumulator
+# --------------------
+class ReplyStream:
+    """
+    Collects a streamed reply.
+    Chunks are coalesced and flushed at most every `interval` seconds (or once
+    `max_pending` characters are waiting), and each chunk is HTML-escaped
+    once, so a long reply costs O(n) escaping and a bounded number of flushes.
+    on_flush(stream) is called on every flush.
+    """
+
+    def __init__(self, on_flush=None, interval=0.1, max_pending=400):
+        self.on_flush = on_flush
+        self.interval = interval
+        self.max_pending = max_pending
+        self.parts = []
+        self.escaped = []
+        self.pending = []
+        self.pending_chars = 0
+        self.chunks = 0
+        self.started = time.perf_counter()
+        self.first_chunk_at = None
+        self.finished_at = None
+        self.last_flush = 0.0
+
+    def add(self, chunk):
+        if not chunk:
+            return
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+        self.chunks += 1
+        self.pending.append(chunk)
+        self.pending_chars += len(chunk)
+        if now - self.last_flush >= self.interval or self.pending_chars >= self.max_pending:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            new_text = "".join(self.pending)
+            self.parts.append(new_text)
+            self.escaped.append(html.escape(new_text))
+            self.pending = []
+            self.pending_chars = 0
+        if self.on_flush is not None:
+            self.on_flush(self)
+        self.last_flush = time.perf_counter()
+
+    def finish(self):
+        """Flushes what is left and returns the full reply text."""
+        self.finished_at = time.perf_counter()
+        self.flush()
+        return self.text
+
+    @property
+    def text(self):
+        return "".join(self.parts) + "".join(self.pending)
+
+    @property
+    def escaped_text(self):
+        """HTML-escaped text flushed so far."""
+        return "".join(self.escaped)
+
+    def stats(self):
+        """Time to first token and generation rate, counting one token per streamed chunk."""
+        if self.first_chunk_at is None:
+            return {"ttft": None, "tokens": 0, "tokens_per_sec": None}
+        end = self.finished_at or time.perf_counter()
+        generating = end - self.first_chunk_at
+        return {
+            "ttft": round(self.first_chunk_at - self.started, 3),
+            "tokens": self.chunks,
+            "tokens_per_sec": round(self.chunks / generating, 1) if generating > 0 else None,
+        }
+
+
+def stats_footer(stats):
+    """
+    Small HTML line shown under a reply, e.g. "⏱ first token 0.42s · 180 tokens · 31.5 tokens/s".
+    Ollama's own eval_count/eval_duration are preferred over the chunk count when present.
+    """
+    if not stats or stats.get("ttft") is None:
+        return ""
+    tokens, rate = stats["tokens"], stats.get("tokens_per_sec")
+    if stats.get("eval_count") and stats.get("eval_duration"):
+        tokens, rate = stats["eval_count"], round(stats["eval_count"] / stats["eval_duration"], 1)
+    rate = f" · {rate} tokens/s" if rate else ""
+    load = f" · model load {stats['load_duration']:.1f}s" if stats.get("load_duration", 0) >= 0.5 else ""
+    return f'<div class="reply-stats">⏱ first token {stats["ttft"]:.2f}s · {tokens} tokens{rate}{load}</div>'